@@ -0,0 +1,337 @@
+import time
+from functools import lru_cache
+from typing import NamedTuple
+
+import numpy as np
+
+
+def d_hondt(votes, seats):
+    quotients = [(vote_count / i, party) for party, vote_count in votes.items() for i in range(1, seats + 1)]
+    quotients.sort(reverse=True, key=lambda x: x[0])
+    seat_allocation = {}
+    for _, party in quotients[:seats]:
+        seat_allocation[party] = seat_allocation.get(party, 0) + 1
+    return seat_allocation
+
+def sainte_lague(votes, seats):
+    quotients = [(vote_count / (2 * i + 1), party) for party, vote_count in votes.items() for i in range(seats)]
+    quotients.sort(reverse=True, key=lambda x: x[0])
+    seat_allocation = {}
+    for _, party in quotients[:seats]:
+        seat_allocation[party] = seat_allocation.get(party, 0) + 1
+    return seat_allocation
+
+def modified_sainte_lague(votes, seats):
+    quotients = [(vote_count / 1.4, party) for party, vote_count in votes.items()]
+    for party, vote_count in votes.items():
+        quotients.extend([(vote_count / (2 * i + 1), party) for i in range(1, seats)])
+    quotients.sort(reverse=True, key=lambda x: x[0])
+    seat_allocation = {}
+    for _, party in quotients[:seats]:
+        seat_allocation[party] = seat_allocation.get(party, 0) + 1
+    return seat_allocation
+
+def largest_remainder(votes, seats, quota_func):
+    total_votes = sum(votes.values())
+    quota = quota_func(total_votes, seats)
+    allocation = {party: int(vote_count // quota) for party, vote_count in votes.items()}
+    remainders = {party: vote_count % quota for party, vote_count in votes.items()}
+    remaining_seats = seats - sum(allocation.values())
+    sorted_remainders = sorted(remainders.items(), key=lambda x: x[1], reverse=True)
+    for party, _ in sorted_remainders[:remaining_seats]:
+        allocation[party] += 1
+    return allocation
+
+def imperiali(votes, seats):
+    quotients = [(vote_count / (i + 2), party) for party, vote_count in votes.items() for i in range(seats)]
+    quotients.sort(reverse=True, key=lambda x: x[0])
+    seat_allocation = {}
+    for _, party in quotients[:seats]:
+        seat_allocation[party] = seat_allocation.get(party, 0) + 1
+    return seat_allocation
+
+def stv_approximation(votes, seats):
+    # Party-level stand-in for the Single Transferable Vote: with transfers
+    # kept within parties, each Droop quota elects a candidate and the last
+    # seats go to the largest surpluses once weaker candidates are eliminated.
+    return largest_remainder(votes, seats, droop_quota)
+
+def hare_quota(total_votes, seats):
+    return total_votes / seats
+
+def droop_quota(total_votes, seats):
+    return total_votes // (seats + 1) + 1
+
+def allocate_seats(votes, method, seats, threshold, quota_func=None):
+    total_votes = sum(votes.values())
+    votes = {party: vote for party, vote in votes.items() if vote / total_votes >= threshold}
+    if method == largest_remainder:
+        return method(votes, seats, quota_func)
+    else:
+        return method(votes, seats)
+
+
+# Vectorized kernels.
+#
+# The functions above are the reference definitions of each method. The
+# kernels below compute the same allocations on arrays of shape
+# (..., parties), so one call covers many constituencies or many simulated
+# scenarios. Ties are broken exactly as the stable sorts above break them:
+# by party order, and for modified Sainte-Laguë every first (1.4) quotient
+# ranks ahead of the later quotients it ties with.
+
+class MethodSpec(NamedTuple):
+    """How the kernels run a registered allocation method.
+
+    Divisor methods give ``divisors``, a function from seat positions
+    (0, 1, ...) to divisors, and ``priority``, the number of leading divisors
+    whose quotients win ties against later ones. Quota methods have no
+    divisors; their ``quota_func`` is fixed, or None to use the rule's own
+    (Hare by default).
+    """
+    divisors: object = None
+    priority: int = 0
+    quota_func: object = None
+
+_methods = {}
+
+def register_method(method, divisors=None, priority=0, quota_func=None):
+    """Make ``method`` usable in ``country_methods`` style rules."""
+    _methods[method] = MethodSpec(divisors, priority, quota_func)
+    compile_method.cache_clear()
+    _compile_plan.cache_clear()
+
+class MethodPlan(NamedTuple):
+    """A rule compiled for the kernels, and the constituencies it applies to.
+
+    ``divisors`` holds the divisors for ``seats`` seats of a divisor method
+    and is None for quota methods, which use ``quota_func`` instead.
+    ``indexes`` and ``thresholds`` are the rows of the vote matrix the rule
+    allocates and their thresholds; they are None for a bare compiled method.
+    Arrays are shared between plans and read-only.
+    """
+    method: object
+    seats: int
+    quota_func: object
+    divisors: object
+    priority: int
+    indexes: object = None
+    thresholds: object = None
+
+@lru_cache(maxsize=1024)
+def compile_method(method, seats, quota_func=None):
+    """Compile ``method`` for ``seats`` seats into a ``MethodPlan``."""
+    if method not in _methods:
+        raise ValueError(f"{getattr(method, '__name__', method)} is not a registered allocation method.")
+    spec = _methods[method]
+    if spec.divisors is None:
+        return MethodPlan(method, seats, spec.quota_func or quota_func or hare_quota, None, 0)
+    divisors = spec.divisors(np.arange(seats, dtype=float))
+    divisors.flags.writeable = False
+    return MethodPlan(method, seats, None, divisors, spec.priority)
+
+def _sequential_sum(values):
+    # np.sum uses pairwise summation, which can differ from Python's sum()
+    # in the last bit. A running sum reproduces the reference totals exactly.
+    if values.shape[-1] == 0:
+        return np.zeros(values.shape[:-1])
+    return np.cumsum(values, axis=-1)[..., -1]
+
+def _kth_largest(flat, k):
+    """Per row of ``flat``, the ``k``-th largest value (+inf where k is 0)."""
+    n = flat.shape[-1]
+    k = np.minimum(k, n)
+    threshold = np.full(flat.shape[0], np.inf)
+    rows = np.nonzero(k > 0)[0]
+    if rows.size:
+        positions = n - k[rows]
+        partitioned = np.partition(flat[rows], np.unique(positions), axis=-1)
+        threshold[rows] = partitioned[np.arange(rows.size), positions]
+    return threshold
+
+def _select_top(quotients, k, priority=0):
+    """Count, per party, how many of the ``k`` largest quotients it holds.
+
+    ``quotients`` has shape (rows, parties, columns) and ``k`` shape (rows,).
+    Entries equal to -inf are never selected. Quotients tied with the cut-off
+    value are handed out in the order the reference sort would list them.
+    """
+    rows, parties, columns = quotients.shape
+    threshold = _kth_largest(quotients.reshape(rows, parties * columns), k)[:, None, None]
+    counts = (quotients > threshold).sum(axis=-1)
+    left = k - counts.sum(axis=-1)
+    tied = (quotients == threshold) & (quotients > -np.inf)
+    if priority:
+        ties = np.concatenate([tied[..., :priority].sum(axis=-1), tied[..., priority:].sum(axis=-1)], axis=-1)
+    else:
+        ties = tied.sum(axis=-1)
+    before = np.cumsum(ties, axis=-1) - ties
+    taken = np.clip(left[:, None] - before, 0, ties)
+    return counts + taken.reshape(rows, -1, parties).sum(axis=1)
+
+def _as_rows(votes, seats):
+    votes = np.asarray(votes, dtype=float)
+    shape = votes.shape
+    seats = np.broadcast_to(np.asarray(seats, dtype=np.int64), shape[:-1]).reshape(-1)
+    return votes.reshape(-1, shape[-1]), seats, shape
+
+def allocate_divisor_batch(votes, seats, method, eligible=None):
+    """Allocate seats with a divisor method for every row of ``votes``.
+
+    ``votes`` has shape (..., parties), ``seats`` is a scalar or broadcasts
+    to the leading dimensions, and ``eligible`` optionally masks out parties
+    that may not win seats. Returns an integer array shaped like ``votes``.
+    Raises ValueError if ``method`` is not a divisor method.
+    """
+    max_seats = int(np.max(seats)) if np.size(seats) else 0
+    method_plan = compile_method(method, max_seats)
+    if method_plan.divisors is None:
+        raise ValueError(f"{getattr(method, '__name__', method)} is not a divisor method.")
+    return _allocate_divisors(votes, seats, method_plan, eligible)
+
+def _allocate_divisors(votes, seats, method_plan, eligible):
+    rows, seats, shape = _as_rows(votes, seats)
+    if eligible is not None:
+        eligible = np.broadcast_to(eligible, shape).reshape(rows.shape)
+    divisors = method_plan.divisors
+    unused = np.arange(divisors.size) >= seats[:, None, None]
+    if eligible is not None:
+        unused = unused | ~eligible[:, :, None]
+    quotients = np.where(unused, -np.inf, rows[:, :, None] / divisors)
+    allocation = _select_top(quotients, seats, method_plan.priority)
+    return allocation.reshape(shape)
+
+def allocate_largest_remainder_batch(votes, seats, quota_func=hare_quota, eligible=None):
+    """Allocate seats by largest remainder for every row of ``votes``.
+
+    ``quota_func`` receives arrays of total votes and seats per row.
+    """
+    rows, seats, shape = _as_rows(votes, seats)
+    if eligible is None:
+        eligible = np.ones(rows.shape, dtype=bool)
+    else:
+        eligible = np.broadcast_to(eligible, shape).reshape(rows.shape)
+    counted = np.where(eligible, rows, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        quota = quota_func(_sequential_sum(counted), seats)[:, None]
+        whole = np.where(eligible, counted // quota, 0.0)
+        remainders = np.where(eligible, counted % quota, -np.inf)
+    valid = eligible.any(axis=-1)
+    whole[~valid] = 0
+    allocation = whole.astype(np.int64)
+    remaining = np.where(valid, np.maximum(seats - allocation.sum(axis=-1), 0), 0)
+    allocation += _select_top(remainders[:, :, None], remaining)
+    return allocation.reshape(shape)
+
+def eligible_parties(votes, threshold):
+    """Mask of parties with votes and at least ``threshold`` of the row's total."""
+    votes = np.asarray(votes, dtype=float)
+    positive = votes > 0
+    total = _sequential_sum(np.where(positive, votes, 0.0))[..., None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return positive & (votes / total >= np.asarray(threshold)[..., None])
+
+def allocate_seats_batch(votes, method, seats, threshold, quota_func=None):
+    """Array counterpart of ``allocate_seats``.
+
+    Parties without votes, or below ``threshold`` of the row's total, win no
+    seats, matching the filtering done before ``allocate_seats`` is called.
+    """
+    max_seats = int(np.max(seats)) if np.size(seats) else 0
+    return _allocate_rule(votes, seats, threshold, compile_method(method, max_seats, quota_func))
+
+def _allocate_rule(votes, seats, threshold, method_plan):
+    votes = np.asarray(votes, dtype=float)
+    eligible = eligible_parties(votes, threshold)
+    if method_plan.divisors is None:
+        return allocate_largest_remainder_batch(votes, seats, method_plan.quota_func, eligible)
+    return _allocate_divisors(votes, seats, method_plan, eligible)
+
+def build_plan(constituencies, methods):
+    """Compile the rules of ``methods`` for a vote matrix.
+
+    ``constituencies`` lists the row order of the vote matrix and
+    ``methods`` maps constituency names to ``country_methods`` style rule
+    lists, where an optional fourth element is the quota function. Returns a
+    list of ``MethodPlan``, one per distinct rule (and per repeat of a rule
+    within a constituency), each holding the positions of its constituencies and their thresholds so one kernel call
+    allocates all of them. Plans are cached on the rules, so reruns and
+    simulation batches reuse them.
+    """
+    rules = tuple((constituency, tuple(tuple(rule) for rule in method_params))
+                  for constituency, method_params in methods.items())
+    return _compile_plan(tuple(constituencies), rules)
+
+@lru_cache(maxsize=64)
+def _compile_plan(constituencies, rules):
+    position = {name: i for i, name in enumerate(constituencies)}
+    groups = {}
+    for constituency, method_params in rules:
+        if constituency not in position:
+            continue
+        repeats = {}
+        for method, seats, threshold, *extra in method_params:
+            rule = (method, seats, *extra[:1])
+            # A constituency that lists the same rule twice goes into a second
+            # entry, so that no entry indexes a row twice and each sum counts.
+            repeat = repeats[rule] = repeats.get(rule, -1) + 1
+            indexes, thresholds = groups.setdefault((rule, repeat), ([], []))
+            indexes.append(position[constituency])
+            thresholds.append(threshold)
+    plan = []
+    for (rule, _), (indexes, thresholds) in groups.items():
+        indexes = np.array(indexes)
+        thresholds = np.array(thresholds, dtype=float)
+        indexes.flags.writeable = False
+        thresholds.flags.writeable = False
+        plan.append(compile_method(*rule)._replace(indexes=indexes, thresholds=thresholds))
+    return plan
+
+def allocate_matrix(matrix, constituencies, methods, timer=None):
+    """Allocate seats for every constituency row of a vote matrix.
+
+    Returns the seat matrix and a mask of the parties each constituency lists
+    in its result: those that won seats and, for quota methods, every
+    eligible party, as ``largest_remainder`` reports them with zero seats.
+    With a ``timer`` (an ``instrumentation.RunTimer``) each constituency is
+    recorded with its share of its batch's wall time.
+    """
+    matrix = np.asarray(matrix, dtype=float)
+    seats = np.zeros(matrix.shape, dtype=np.int64)
+    listed = np.zeros(matrix.shape, dtype=bool)
+    for method_plan in build_plan(constituencies, methods):
+        start = time.perf_counter()
+        indexes = method_plan.indexes
+        votes = matrix[indexes]
+        allocation = _allocate_rule(votes, method_plan.seats, method_plan.thresholds, method_plan)
+        seats[indexes] += allocation
+        listed[indexes] |= allocation > 0
+        if method_plan.divisors is None:
+            listed[indexes] |= eligible_parties(votes, method_plan.thresholds)
+        if timer is not None:
+            share = (time.perf_counter() - start) / len(indexes)
+            for index in indexes:
+                timer.record('constituency', share, constituency=constituencies[index],
+                             method=method_plan.method.__name__, seats=method_plan.seats, batch=len(indexes))
+    return seats, listed
+
+def allocate_plan(votes, plan):
+    """Seats for ``votes`` of shape (..., constituencies, parties) under ``plan``.
+
+    Leading dimensions hold independent scenarios or draws; each plan entry is
+    allocated for all of them in one kernel call.
+    """
+    votes = np.asarray(votes, dtype=float)
+    seats = np.zeros(votes.shape, dtype=np.int64)
+    for method_plan in plan:
+        indexes = method_plan.indexes
+        seats[..., indexes, :] += _allocate_rule(votes[..., indexes, :], method_plan.seats, method_plan.thresholds, method_plan)
+    return seats
+
+
+register_method(d_hondt, lambda i: i + 1)
+register_method(sainte_lague, lambda i: 2 * i + 1)
+register_method(modified_sainte_lague, lambda i: np.where(i == 0, 1.4, 2 * i + 1), priority=1)
+register_method(imperiali, lambda i: i + 2)
+register_method(largest_remainder)
+register_method(stv_approximation, quota_func=droop_quota)
@@ -0,0 +1,79 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from allocation import allocate_matrix
+from election_model import calculate_stemmer
+
+
+class AllocationCache:
+    """Per-constituency seat allocations, recomputed only when inputs change.
+
+    Each constituency is keyed on its share vector, turnout, electorate and
+    allocation rules. ``allocate`` serves unchanged constituencies from the
+    cache, allocates the rest in one batch, and updates the running seat
+    totals by the difference. At most ``max_entries`` allocations are kept;
+    the least recently used ones are evicted first.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._groups = None
+        self._current = {}
+        self.totals = None
+
+    @staticmethod
+    def _key(model, d, rules):
+        return (model.shares[d].tobytes(), float(model.turnout[d]), float(model.electorate[d]), rules)
+
+    def _reset(self, groups):
+        self._entries.clear()
+        self._current = {}
+        self._groups = groups
+        self.totals = np.zeros(len(groups), dtype=np.int64)
+
+    def allocate(self, model, methods, timer=None):
+        """Return the seat matrix and listed-party mask for ``model``.
+
+        The results match ``allocate_matrix`` on ``calculate_stemmer(model)``.
+        ``timer`` is passed on to ``allocate_matrix`` for the re-allocated
+        constituencies.
+        """
+        groups = tuple(model.groups)
+        if groups != self._groups:
+            self._reset(groups)
+        keys = [self._key(model, d, tuple(tuple(rule) for rule in methods.get(distrikt, ())))
+                for d, distrikt in enumerate(model.districts)]
+        missing = [d for d, key in enumerate(keys) if key not in self._entries]
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            subset = model._replace(
+                districts=[model.districts[d] for d in missing],
+                shares=model.shares[missing],
+                turnout=model.turnout[missing],
+                electorate=model.electorate[missing],
+            )
+            seats, listed = allocate_matrix(calculate_stemmer(subset), subset.districts, methods, timer)
+            for row, d in enumerate(missing):
+                self._entries[keys[d]] = (seats[row].copy(), listed[row].copy())
+
+        seats = np.zeros(model.shares.shape, dtype=np.int64)
+        listed = np.zeros(model.shares.shape, dtype=bool)
+        for d, (distrikt, key) in enumerate(zip(model.districts, keys)):
+            self._entries.move_to_end(key)
+            seats[d], listed[d] = self._entries[key]
+            previous = self._current.get(distrikt)
+            if previous is None or previous[0] != key:
+                if previous is not None:
+                    self.totals -= previous[1]
+                self.totals += seats[d]
+                self._current[distrikt] = (key, seats[d].copy())
+        for distrikt in set(self._current) - set(model.districts):
+            self.totals -= self._current.pop(distrikt)[1]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return seats, listed
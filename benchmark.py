@@ -0,0 +1,259 @@
+"""Benchmarks for the seat allocation methods, the votes-to-seats pipeline and
+the seat-flip sensitivity.
+
+    python benchmark.py                  # run and print the results
+    python benchmark.py --save           # also store them as the baseline
+    python benchmark.py --compare        # fail if slower than the baseline
+
+Every vectorized result is checked against the reference implementations
+before it is timed, and seat-flip votes are checked by re-allocating on
+both sides of each boundary. Timings are the best of several runs; peak
+memory is measured separately with tracemalloc.
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from allocation import (
+    allocate_matrix,
+    allocate_seats,
+    allocate_seats_batch,
+    d_hondt,
+    hare_quota,
+    imperiali,
+    largest_remainder,
+    modified_sainte_lague,
+    sainte_lague,
+    stv_approximation,
+)
+from election_model import ElectionModel, calculate_stemmer, votes_frame
+from sensitivity import seat_flip_votes, sensitivity_table
+from simulator_core import allocate_seats_by_constituencies, allocation_frame, country_methods, default_model
+
+METHODS = {
+    'd_hondt': d_hondt,
+    'sainte_lague': sainte_lague,
+    'modified_sainte_lague': modified_sainte_lague,
+    'imperiali': imperiali,
+    'largest_remainder': largest_remainder,
+    'stv_approximation': stv_approximation,
+}
+PARTY_COUNTS = (2, 8, 50, 200)
+SEAT_COUNTS = (1, 10, 100, 1000)
+CONSTITUENCY_COUNTS = (1000, 5000)
+# Random constituencies whose seat-flip votes are checked by re-allocation.
+SENSITIVITY_CASES = 300
+# Rows allocated per kernel call in the method grid, capped so that a call
+# holds at most QUOTIENT_BUDGET quotients.
+BATCH_ROWS = 100
+QUOTIENT_BUDGET = 2_000_000
+
+
+def measure(func, min_time=0.2, max_repeat=20):
+    """Best wall time of ``func`` over repeated runs, and its peak memory."""
+    func()
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < max_repeat and (len(timings) < 3 or time.perf_counter() - started < min_time):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(timings), peak
+
+def reference_rows(votes, method, seats, threshold=0.0):
+    """Allocate each row with the reference functions, as a seat matrix."""
+    result = np.zeros(votes.shape, dtype=np.int64)
+    for row, vote_row in enumerate(votes):
+        allocation = allocate_seats(dict(enumerate(vote_row)), method, seats, threshold, hare_quota)
+        for party, seat_count in allocation.items():
+            result[row, party] = seat_count
+    return result
+
+def bench_methods(rng):
+    results = []
+    for name, method in METHODS.items():
+        for parties in PARTY_COUNTS:
+            for seats in SEAT_COUNTS:
+                rows = max(1, min(BATCH_ROWS, QUOTIENT_BUDGET // (parties * seats)))
+                votes = rng.integers(1, 1_000_000, size=(rows, parties)).astype(float)
+                one = votes[:1]
+                checked = votes[:max(1, min(rows, QUOTIENT_BUDGET // 100 // (parties * seats)))]
+                expected = reference_rows(checked, method, seats)
+                if not (allocate_seats_batch(checked, method, seats, 0.0, hare_quota) == expected).all():
+                    raise AssertionError(f"{name} differs from the reference for {parties} parties, {seats} seats.")
+                reference_time, _ = measure(lambda: reference_rows(one, method, seats))
+                kernel_time, kernel_peak = measure(lambda: allocate_seats_batch(votes, method, seats, 0.0, hare_quota))
+                results.append({
+                    'benchmark': f"{name}/{parties}p/{seats}s",
+                    'reference_s': reference_time,
+                    'batch_s': kernel_time,
+                    'allocations_per_s': rows / kernel_time,
+                    'speedup': reference_time * rows / kernel_time,
+                    'peak_bytes': kernel_peak,
+                })
+    return results
+
+def synthetic_model(rng, constituencies):
+    """A model with ``constituencies`` random constituencies and their rules.
+
+    Rules are copied round-robin from ``country_methods`` so that the mix of
+    methods, seat counts and thresholds matches the real data.
+    """
+    base = default_model()
+    rules = list(country_methods.values())
+    districts = [f"C{i}" for i in range(constituencies)]
+    model = ElectionModel(
+        groups=base.groups,
+        categories=base.categories,
+        districts=districts,
+        shares=rng.dirichlet(np.ones(len(base.groups)), size=constituencies),
+        turnout=rng.uniform(0.3, 0.8, size=constituencies),
+        electorate=rng.integers(50_000, 10_000_000, size=constituencies).astype(float),
+    )
+    return model, {distrikt: rules[i % len(rules)] for i, distrikt in enumerate(districts)}
+
+def pipeline(model, methods):
+    votes = calculate_stemmer(model)
+    votes_frame(model, votes)
+    seats, listed = allocate_matrix(votes, model.districts, methods)
+    frame = allocation_frame(seats, listed, model.districts, model.groups, methods)
+    return frame.groupby(['Parti', 'Constituency']).agg({'Seats': 'sum'}).reset_index()
+
+def frame_pipeline(model, methods):
+    """The public DataFrame entry point, including its pivot to a matrix."""
+    frame = allocate_seats_by_constituencies(votes_frame(model, calculate_stemmer(model)), methods)
+    return frame.groupby(['Parti', 'Constituency']).agg({'Seats': 'sum'}).reset_index()
+
+def reference_pipeline(model, methods):
+    votes = calculate_stemmer(model)
+    seats = np.zeros(votes.shape, dtype=np.int64)
+    for d, distrikt in enumerate(model.districts):
+        vote_dict = {g: vote for g, vote in enumerate(votes[d]) if vote > 0}
+        for method, seat_count, threshold, *extra in methods[distrikt]:
+            for g, seat in allocate_seats(vote_dict, method, seat_count, threshold, (extra or [hare_quota])[0]).items():
+                seats[d, g] += seat
+    return seats
+
+def repeated_rules(methods):
+    """``methods`` with every rule listed a second time at a higher threshold.
+
+    A constituency's results are summed over its rules, so repeating a rule
+    must add its seats again rather than overwrite them.
+    """
+    return {distrikt: [*rules, *((method, seats, threshold + 0.05, *extra) for method, seats, threshold, *extra in rules)]
+            for distrikt, rules in methods.items()}
+
+def bench_pipeline(rng):
+    cases = [('default', default_model(), country_methods)]
+    cases += [(f"synthetic/{n}", *synthetic_model(rng, n)) for n in CONSTITUENCY_COUNTS]
+    cases.append(('repeated', default_model(), repeated_rules(country_methods)))
+    results = []
+    for name, model, methods in cases:
+        expected = reference_pipeline(model, methods)
+        seats, _ = allocate_matrix(calculate_stemmer(model), model.districts, methods)
+        frame_seats, _, _ = allocate_seats_by_constituencies(votes_frame(model, calculate_stemmer(model)), methods, as_frame=False)
+        if not (seats == expected).all() or not (frame_seats == expected).all():
+            raise AssertionError(f"Pipeline {name} differs from the reference allocation.")
+        for label, run in (('pipeline', pipeline), ('pipeline/frame', frame_pipeline)):
+            elapsed, peak = measure(lambda: run(model, methods), max_repeat=5)
+            results.append({
+                'benchmark': f"{label}/{name}",
+                'batch_s': elapsed,
+                'constituencies_per_s': len(model.districts) / elapsed,
+                'peak_bytes': peak,
+            })
+    return results
+
+def check_seat_flips(votes, method, seats, threshold):
+    """Re-allocate just before and after every seat-flip boundary.
+
+    Returns the (party, change) pairs where the allocation does not flip
+    there. NaN changes, which the Hare-only closed form gives for other
+    quotas, are skipped.
+    """
+    current, gain, loss = seat_flip_votes(votes, method, seats, threshold)
+    failures = []
+    for party in range(votes.size):
+        for change, sign in ((gain[party], 1), (loss[party], -1)):
+            if np.isnan(change):
+                continue
+            step = 1e-6 * max(1.0, votes[party]) + 1e-3
+            before = votes.copy()
+            after = votes.copy()
+            before[party] += change - sign * step
+            after[party] = max(votes[party] + change + sign * step, 0.0)
+            seats_before = allocate_seats_batch(before, method, seats, threshold)[party]
+            seats_after = allocate_seats_batch(after, method, seats, threshold)[party]
+            flipped = seats_after > current[party] if sign > 0 else seats_after < current[party]
+            if seats_before != current[party] or not flipped:
+                failures.append((party, change))
+    return failures
+
+def bench_sensitivity(rng):
+    for case in range(SENSITIVITY_CASES):
+        name, method = list(METHODS.items())[case % len(METHODS)]
+        votes = rng.integers(0, 100_000, size=int(rng.integers(2, 9))).astype(float)
+        seats = int(rng.integers(1, 30))
+        threshold = float(rng.choice([0.0, 0.03, 0.05, 0.15]))
+        failures = check_seat_flips(votes, method, seats, threshold)
+        if failures:
+            raise AssertionError(f"{name} seat flips at {failures} do not change the allocation of {votes.tolist()}, "
+                                 f"{seats} seats, threshold {threshold}.")
+    results = []
+    cases = [('default', default_model(), country_methods), ('synthetic/1000', *synthetic_model(rng, 1000))]
+    for name, model, methods in cases:
+        elapsed, peak = measure(lambda: sensitivity_table(model, methods), max_repeat=5)
+        results.append({
+            'benchmark': f"sensitivity/{name}",
+            'batch_s': elapsed,
+            'constituencies_per_s': len(model.districts) / elapsed,
+            'peak_bytes': peak,
+        })
+    return results
+
+def compare(results, baseline, tolerance):
+    """Benchmarks more than ``tolerance`` times slower than the baseline."""
+    previous = {entry['benchmark']: entry['batch_s'] for entry in baseline}
+    return [(entry['benchmark'], previous[entry['benchmark']], entry['batch_s'])
+            for entry in results
+            if entry['benchmark'] in previous and entry['batch_s'] > previous[entry['benchmark']] * tolerance]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the seat allocation methods and pipeline.")
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help="Baseline file to save or compare with.")
+    parser.add_argument('--save', action='store_true', help="Store the results as the new baseline.")
+    parser.add_argument('--compare', action='store_true', help="Exit with an error on regressions against the baseline.")
+    parser.add_argument('--tolerance', type=float, default=1.5, help="Allowed slowdown factor when comparing.")
+    parser.add_argument('--skip-methods', action='store_true', help="Skip the allocation method grid.")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(2024)
+    results = [] if args.skip_methods else bench_methods(rng)
+    results += bench_pipeline(rng)
+    results += bench_sensitivity(rng)
+    for entry in results:
+        details = ', '.join(f"{key}={value:.4g}" for key, value in entry.items() if key != 'benchmark')
+        print(f"{entry['benchmark']:<40} {details}")
+
+    status = 0
+    if args.compare:
+        with open(args.baseline) as handle:
+            regressions = compare(results, json.load(handle)['results'], args.tolerance)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before:.4g}s -> {after:.4g}s", file=sys.stderr)
+        status = 1 if regressions else 0
+    if args.save:
+        with open(args.baseline, 'w') as handle:
+            json.dump({'numpy': np.__version__, 'python': sys.version.split()[0], 'results': results}, handle, indent=1)
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+TURNOUT_ROW = 'Valgdeltagelse'
+ELECTORATE_ROW = 'Antall personer med stemmerett'
+
+
+class ElectionModel(NamedTuple):
+    """Numeric inputs of the simulation, parsed once from the string table.
+
+    ``shares`` has shape (districts, groups) and holds vote shares as
+    fractions; ``turnout`` (fractions) and ``electorate`` (persons) have one
+    entry per district. Values that could not be parsed are NaN.
+    """
+    groups: list
+    categories: list
+    districts: list
+    shares: np.ndarray
+    turnout: np.ndarray
+    electorate: np.ndarray
+
+
+def parse_percentage(value):
+    try:
+        return float(str(value).strip().strip('%')) / 100
+    except ValueError:
+        return np.nan
+
+def parse_count(value):
+    try:
+        return float(str(value).replace(',', ''))
+    except ValueError:
+        return np.nan
+
+def parse_default_values(values):
+    """Build an ElectionModel from a ``default_values`` style table."""
+    parties = list(values['Parti'])
+    districts = [col for col in values if col not in ['Parti', 'Kategori']]
+    rows = [i for i, party in enumerate(parties) if party not in [TURNOUT_ROW, ELECTORATE_ROW]]
+    turnout_row = parties.index(TURNOUT_ROW)
+    electorate_row = parties.index(ELECTORATE_ROW)
+    return ElectionModel(
+        groups=[parties[i] for i in rows],
+        categories=[values['Kategori'][i] for i in rows],
+        districts=districts,
+        shares=np.array([[parse_percentage(values[d][i]) for i in rows] for d in districts]).reshape(len(districts), len(rows)),
+        turnout=np.array([parse_percentage(values[d][turnout_row]) for d in districts]),
+        electorate=np.array([parse_count(values[d][electorate_row]) for d in districts]),
+    )
+
+def calculate_stemmer(model):
+    """Votes per district and group as a (districts, groups) matrix."""
+    return model.shares * model.turnout[:, None] * model.electorate[:, None]
+
+def votes_frame(model, votes):
+    """Long ``Parti``/``Distrikt``/``Stemmer``/``Kategori`` view of a vote matrix.
+
+    Rows are ordered by group, then district, like the table in the app.
+    """
+    n_districts, n_groups = votes.shape
+    return pd.DataFrame({
+        'Parti': np.repeat(np.array(model.groups, dtype=object), n_districts),
+        'Distrikt': np.tile(np.array(model.districts, dtype=object), n_groups),
+        'Stemmer': votes.T.reshape(-1),
+        'Kategori': np.repeat(np.array(model.categories), n_districts),
+    })
+
+def apply_share_table(model, table):
+    """Return ``model`` with the values of a pasted or uploaded share table.
+
+    ``table`` is laid out like ``default_values``: a ``Parti`` column with
+    group names, optionally a turnout row (``Valgdeltagelse`` or
+    ``Turnout``), and one column of percentages per district. A
+    ``Kategori`` column and an electorate row, as in ``default_values``, are
+    skipped, and empty cells keep the current value. Unknown groups or districts, cells that are not
+    numbers and values outside 0-100 raise ValueError listing all of them,
+    and nothing is applied.
+    """
+    groups = {name: g for g, name in enumerate(model.groups)}
+    districts = {name: d for d, name in enumerate(model.districts)}
+    shares = model.shares.copy()
+    turnout = model.turnout.copy()
+    problems = [f"unknown constituency {str(column).strip()!r}" for column in table.columns
+                if column not in ['Parti', 'Kategori'] and str(column).strip() not in districts]
+    for _, row in table.iterrows():
+        party = str(row['Parti']).strip()
+        if party == ELECTORATE_ROW:
+            continue
+        if party not in groups and party not in [TURNOUT_ROW, 'Turnout']:
+            problems.append(f"unknown political group {party!r}")
+            continue
+        for column, cell in row.items():
+            d = districts.get(str(column).strip())
+            if d is None or pd.isna(cell) or not str(cell).strip():
+                continue
+            value = parse_percentage(cell)
+            if np.isnan(value):
+                problems.append(f"{party}, {model.districts[d]}: cannot read {cell!r}")
+            elif not 0 <= value <= 1:
+                problems.append(f"{party}, {model.districts[d]}: {value * 100:g} is outside 0-100")
+            elif party in groups:
+                shares[d, groups[party]] = value
+            else:
+                turnout[d] = value
+    if problems:
+        raise ValueError('; '.join(problems) + '.')
+    return model._replace(shares=shares, turnout=turnout)
@@ -1,84 +1,41 @@
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from matplotlib.transforms import Affine2D
 
-st.set_page_config(layout="wide")
+from allocation import build_plan
+from allocation_cache import AllocationCache
+from election_model import apply_share_table, calculate_stemmer, votes_frame
+from hemicycle import hemicycle_svg
+from instrumentation import RunTimer, profile_run
+from sensitivity import sensitivity_table
+from simulation import simulate_seats, summarize_draws
+from simulator_core import allocation_frame, country_methods, default_model, default_values, missing_constituencies
 
-def d_hondt(votes, seats):
-    quotients = [(vote_count / i, party) for party, vote_count in votes.items() for i in range(1, seats + 1)]
-    quotients.sort(reverse=True, key=lambda x: x[0])
-    seat_allocation = {}
-    for _, party in quotients[:seats]:
-        seat_allocation[party] = seat_allocation.get(party, 0) + 1
-    return seat_allocation
-
-def sainte_lague(votes, seats):
-    quotients = [(vote_count / (2 * i + 1), party) for party, vote_count in votes.items() for i in range(seats)]
-    quotients.sort(reverse=True, key=lambda x: x[0])
-    seat_allocation = {}
-    for _, party in quotients[:seats]:
-        seat_allocation[party] = seat_allocation.get(party, 0) + 1
-    return seat_allocation
-
-def modified_sainte_lague(votes, seats):
-    quotients = [(vote_count / 1.4, party) for party, vote_count in votes.items()]
-    for party, vote_count in votes.items():
-        quotients.extend([(vote_count / (2 * i + 1), party) for i in range(1, seats)])
-    quotients.sort(reverse=True, key=lambda x: x[0])
-    seat_allocation = {}
-    for _, party in quotients[:seats]:
-        seat_allocation[party] = seat_allocation.get(party, 0) + 1
-    return seat_allocation
-
-def largest_remainder(votes, seats, quota_func):
-    total_votes = sum(votes.values())
-    quota = quota_func(total_votes, seats)
-    allocation = {party: int(vote_count // quota) for party, vote_count in votes.items()}
-    remainders = {party: vote_count % quota for party, vote_count in votes.items()}
-    remaining_seats = seats - sum(allocation.values())
-    sorted_remainders = sorted(remainders.items(), key=lambda x: x[1], reverse=True)
-    for party, _ in sorted_remainders[:remaining_seats]:
-        allocation[party] += 1
-    return allocation
-
-def hare_quota(total_votes, seats):
-    return total_votes / seats
-
-def convert_to_float(value):
-    try:
-        return float(value.strip('%')) / 100.0
-    except ValueError:
-        return 0.0
-
-def allocate_seats(votes, method, seats, threshold, quota_func=None):
-    total_votes = sum(votes.values())
-    votes = {party: vote for party, vote in votes.items() if vote / total_votes >= threshold}
-    if method == largest_remainder:
-        return method(votes, seats, quota_func)
-    else:
-        return method(votes, seats)
+st.set_page_config(layout="wide")
 
-def allocate_seats_by_constituencies(df, methods):
-    results = []
-    for constituency, method_params in methods.items():
-        if constituency not in df['Distrikt'].unique():
-            st.warning(f"Column for {constituency} not found in the data.")
-            continue
-        for method_name, seats, threshold, *extra in method_params:
-            method = method_name
-            votes = {party: df[(df['Distrikt'] == constituency) & (df['Parti'] == party)]['Stemmer'].values[0] for party in df['Parti'].unique() if df[(df['Distrikt'] == constituency) & (df['Parti'] == party)]['Stemmer'].values[0] > 0}
-            allocation = allocate_seats(votes, method, seats, threshold, hare_quota)
-            for party, seat_count in allocation.items():
-                results.append({'Parti': party, 'Constituency': constituency, 'Seats': seat_count})
-    return pd.DataFrame(results)
-
-def plot_half_circle_chart(data, colors, kategori_mapping):
-    
-    aggregated_data = data.groupby(['Parti', 'Kategori']).sum().reset_index()
-    aggregated_data = aggregated_data.sort_values(by='Kategori', ascending=False)
-   
+# Every rerun records its stage timings. They are written as JSON lines to
+# the file named by SIMULATOR_TIMING_LOG (otherwise to the 'simulator.timing'
+# logger, which needs logging configured to show them) and shown in the
+# optional performance panel. A profiler requested from the panel wraps the
+# whole next rerun.
+timer = RunTimer()
+
+@st.cache_data(max_entries=128)
+def render_half_circle_chart(parties, kategorier, seats, colors):
+    """PNG of the half circle chart, cached on the aggregated seat vector.
+
+    The figure is built without pyplot, so nothing keeps it alive once the
+    image has been saved.
+    """
+    aggregated_data = pd.DataFrame({'Parti': parties, 'Kategori': kategorier, 'Seats': seats})
     fictitious_party = pd.DataFrame({
         'Parti': ['Fiktivt Parti'],
         'Kategori': [0],
@@ -87,14 +44,10 @@ def plot_half_circle_chart(data, colors, kategori_mapping):
     aggregated_data = pd.concat([aggregated_data, fictitious_party], ignore_index=True)
    
     total_mandates = sum(aggregated_data['Seats'])
-   
-    if total_mandates == 0:
-        st.error("The total of seats cannot be zero.")
-        return
-   
     angles = aggregated_data['Seats'] / total_mandates * 360  
    
-    fig, ax = plt.subplots(figsize=(10, 5), subplot_kw=dict(aspect="equal"))
+    fig = Figure(figsize=(10, 5))
+    ax = fig.subplots(subplot_kw=dict(aspect="equal"))
     startangle = 270  
     wedges, texts = ax.pie(
         angles,
@@ -122,10 +75,9 @@ def plot_half_circle_chart(data, colors, kategori_mapping):
         )
         labels.append(label)
    
-    plt.gca().set_aspect('equal')
+    ax.set_aspect('equal')
     fig.tight_layout()
-    plt.gca().set_position([0, 0, 1, 1])
-    fig.canvas.draw()
+    ax.set_position([0, 0, 1, 1])
    
     trans_data = Affine2D().rotate_deg(90) + ax.transData
     for text in texts:
@@ -136,183 +88,248 @@ def plot_half_circle_chart(data, colors, kategori_mapping):
         label.set_transform(trans_data)
    
     ax.set(aspect="equal", title="Seat distribution among political groups\nin the European Parliament")
-    st.pyplot(fig)
-
-default_values = {'Parti': ['EPP', 'S&D', 'ECR', 'RE', 'GUE/NGL', 'G/EFA', 'ID', 'NI', 'Valgdeltagelse', 'Antall personer med stemmerett'], 'Kategori': [8, 3, 9, 6, 1, 5, 10, 11, 11, 11], 'Austria': ['35 %', '24 %', '0 %', '9 %', '0 %', '14 %', '18 %', '0 %', '60 %', '7400000'], 'Belgium_Flemish': ['15 %', '10 %', '19 %', '16 %', '5 %', '12 %', '22 %', '0 %', '88 %', '4700000'], 'Belgium_French': ['10 %', '30 %', '0 %', '22 %', '16 %', '22 %', '0 %', '0 %', '88 %', '3600000'], 'Belgium_German': ['100 %', '0 %', '0 %', '0 %', '0 %', '0 %', '0 %', '0 %', '88 %', '50000'], 'Bulgaria': ['39 %', '31 %', '0 %', '29 %', '0 %', '0 %', '1 %', '0 %', '33 %', '5800000'], 'Croatia': ['47 %', '39 %', '10 %', '0 %', '0 %', '4 %', '0 %', '0 %', '30 %', '3700000'], 'Cyprus': ['26 %', '22 %', '0 %', '19 %', '25 %', '0 %', '0 %', '8 %', '45 %', '700000'], 'Czech Republic': ['24 %', '0 %', '29 %', '0 %', '0 %', '28 %', '18 %', '0 %', '29 %', '8600000'], 'Denmark': ['9 %', '30 %', '0 %', '36 %', '8 %', '18 %', '0 %', '0 %', '66 %', '4500000'], 'Estonia': ['12 %', '27 %', '0 %', '47 %', '0 %', '0 %', '15 %', '0 %', '38 %', '900000'], 'Finland': ['24 %', '17 %', '16 %', '16 %', '8 %', '19 %', '0 %', '0 %', '41 %', '4500000'], 'France': ['18 %', '10 %', '0 %', '0 %', '14 %', '21 %', '37 %', '0 %', '50 %', '48700000'], 'Germany': ['30 %', '17 %', '1 %', '8 %', '7 %', '26 %', '12 %', '0 %', '61 %', '64800000'], 'Greece': ['26 %', '6 %', '3 %', '0 %', '19 %', '0 %', '0 %', '46 %', '59 %', '9900000'], 'Hungary': ['0 %', '55 %', '0 %', '34 %', '0 %', '0 %', '0 %', '11 %', '43 %', '8200000'], 'Ireland_Dublin': ['38 %', '2 %', '0 %', '21 %', '25 %', '15 %', '0 %', '0 %', '50 %', '850000'], 'Ireland_Midland_North_West': ['38 %', '2 %', '0 %', '21 %', '25 %', '15 %', '0 %', '0 %', '50 %', '1300000'], 'Ireland_South': ['38 %', '2 %', '0 %', '21 %', '25 %', '15 %', '0 %', '0 %', '50 %', '1450000'], 'Italy_Central': ['10 %', '25 %', '7 %', '0 %', '0 %', '0 %', '38 %', '19 %', '55 %', '11700000'], 'Italy_Islands': ['10 %', '25 %', '7 %', '0 %', '0 %', '0 %', '38 %', '19 %', '55 %', '6400000'], 'Italy_North_East': ['10 %', '25 %', '7 %', '0 %', '0 %', '0 %', '38 %', '19 %', '55 %', '11500000'], 'Italy_North_West': ['10 %', '25 %', '7 %', '0 %', '0 %', '0 %', '38 %', '19 %', '55 %', '15800000'], 'Italy_Southern': ['10 %', '25 %', '7 %', '0 %', '0 %', '0 %', '38 %', '19 %', '55 %', '13500000'], 'Latvia': ['52 %', '0 %', '32 %', '10 %', '0 %', '6 %', '0 %', '0 %', '34 %', '1500000'], 'Lithuania': ['47 %', '38 %', '0 %', '16 %', '0 %', '0 %', '0 %', '0 %', '53 %', '2400000'], 'Luxembourg': ['29 %', '17 %', '0 %', '29 %', '0 %', '26 %', '0 %', '0 %', '84 %', '500000'], 'Malta': ['59 %', '41 %', '0 %', '0 %', '0 %', '0 %', '0 %', '0 %', '73 %', '400000'], 'Netherlands': ['16 %', '25 %', '9 %', '28 %', '4 %', '14 %', '5 %', '0 %', '42 %', '13300000'], 'Poland_Greater_Poland': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '3250000'], 'Poland_Kuyavian_Pomeranian': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '1800000'], 'Poland_Lesser_Poland_Swietokrzyskie': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '3600000'], 'Poland_Lodz': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '1700000'], 'Poland_Lower_Silesian_Opole': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '2750000'], 'Poland_Lublin': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '1800000'], 'Poland_Lubusz_West_Pomeranian': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '1900000'], 'Poland_Masovian': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '3200000'], 'Poland_Podlaskie_Warmian_Masurian': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '1650000'], 'Poland_Pomeranian': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '1900000'], 'Poland_Silesian': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '3000000'], 'Poland_Subcarpathian': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '1500000'], 'Poland_Warsaw': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '2000000'], 'Portugal': ['30 %', '46 %', '0 %', '3 %', '14 %', '7 %', '0 %', '0 %', '31 %', '9800000'], 'Romania': ['42 %', '29 %', '0 %', '29 %', '0 %', '0 %', '0 %', '0 %', '51 %', '15500000'], 'Slovakia': ['25 %', '0 %', '16 %', '33 %', '0 %', '0 %', '0 %', '26 %', '25 %', '4400000'], 'Slovenia': ['100 %', '0 %', '0 %', '0 %', '0 %', '0 %', '0 %', '0 %', '29 %', '1800000'], 'Spain': ['25 %', '41 %', '8 %', '6 %', '13 %', '7 %', '0 %', '0 %', '61 %', '38100000'], 'Sweden': ['23 %', '32 %', '21 %', '0 %', '9 %', '16 %', '0 %', '0 %', '55 %', '8300000']}
-
-df = pd.DataFrame(default_values)
-districts = [col for col in df.columns if col not in ['Parti', 'Kategori']]
-email_address = "alberto@vthoresen.no"
-st.title("EU Parliament Election Simulator")
-st.markdown(f"Contact: [Alberto Valiente Thoresen](mailto:{email_address})")
-st.markdown("""
-Adjust your forecasts by using the menu on the left. Voter turnout by country can also be updated at the bottom of this menu.
-
-The starting point for the simulation is the forecast "vote share by member state" for the EU Parliament Election 2024, presented [here](https://ecfr.eu/publication/a-sharp-right-turn-a-forecast-for-the-2024-european-parliament-elections/) , with rough population estimates for 2024.
-When not available, vote shares per constituency are estimated on the basis of the expected vote share for the respective member state that the constituency belongs to.
-Default voter turnout is based on voter participation by country in the EU Parliament Election 2019.
-
-In the original forecast, the authors warn that "vote shares do not add up to 100 per cent because we do not show minor parties or votes for 'other' parties." 
-However, in this simulation, vote shares are normalized, so they do add to 100 % by constituency. This starting point might overestimate the number of seats for certain parliamentary groups.
-You also have to take in consideration that the poll, registered as default values, was published in January 2024. 
-But you can update these values by adjusting the sliders, with more accurate and recent forecasts.
-
-This program calculates seat allocation by applying the correct method used in each constituency for the number of seats available, considering current political group thresholds.
-These methods include [D'Hont Method](https://en.wikipedia.org/wiki/D%27Hondt_method), [Sainte-Laguë Method (including the modified version)](https://en.wikipedia.org/wiki/Sainte-Lagu%C3%AB_method) and [Largest Remainder Method](https://en.wikipedia.org/wiki/Largest_remainders_method).
-An overview of the methods used by constituency is presented [here](https://en.wikipedia.org/wiki/2024_European_Parliament_election).
-Results are merely indicative, given that the methods are applied to political groups, and not to political parties in each constituency.
-The actual results will therefore differ, also considering threshold effects. However, the discrepancy will not be too large, since parliamentary groups are often represented by one or few parties in each constituency.
-
-**Note**: For simplicity, this program uses Sainte-Laguë instead of the [Single Transferable Vote (STV)](https://en.wikipedia.org/wiki/Single_transferable_vote) method for Ireland and Malta. The Sainte-Laguë method still provides proportional representation at the political group level. For more information on the intricacies of the STV method, see [Single Transferable Vote - Disadvantages](https://aceproject.org/main/english/es/esf04b.htm). This summary provides a good overview of the challenges involved in forecasting this method solely based on political groups, and programming such forecasts.
-
-A diagram showing the resulting distribution of seats in the forecast will be presented below. It may take some time to visualize.
-""")
-
-percentage_dict = {}
-participation_dict = {}
-st.sidebar.header("You can adjust percentages here")
-for distrikt in districts:
-    if distrikt not in ['Valgdeltagelse', 'Antall personer med stemmerett']:
-        st.sidebar.subheader(distrikt)
-        for index, row in df.iterrows():
-            if row['Parti'] not in ['Valgdeltagelse', 'Antall personer med stemmerett']:
-                default_percentage = float(row[distrikt].strip('%'))
-                modified_percentage = st.sidebar.slider(f"{row['Parti']} ({distrikt})", 0.0, 100.0, default_percentage)
-                percentage_dict[(row['Parti'], distrikt)] = f"{modified_percentage}%"
-st.sidebar.header("You can adjust election turnout by country here")
-for distrikt in districts:
-    if distrikt not in ['Antall personer med stemmerett']:
-        participation_row = df[df['Parti'] == 'Valgdeltagelse']
-        default_participation = float(participation_row[distrikt].values[0].strip('%'))
-        modified_participation = st.sidebar.slider(f"Turnout ({distrikt})", 0.0, 100.0, default_participation)
-        participation_dict[distrikt] = f"{modified_participation}%"
-
-def calculate_stemmer(row, percentage_dict, participation_dict):
-    stemmer_data = []
-    for distrikt in districts:
-        percentage = percentage_dict.get((row['Parti'], distrikt), row[distrikt])
-        valgdeltakelse = participation_dict.get(distrikt, df[df['Parti'] == 'Valgdeltagelse'][distrikt].values[0])
-        personer_med_stemmerett = df[df['Parti'] == 'Antall personer med stemmerett'][distrikt].values[0]
-       
-        if pd.notna(percentage) and pd.notna(valgdeltakelse) and pd.notna(personer_med_stemmerett):
-            percentage_value = float(percentage.strip('%')) / 100
-            valgdeltakelse_value = float(valgdeltakelse.strip('%')) / 100
-            personer_value = float(personer_med_stemmerett.replace(',', ''))
-            stemmer = percentage_value * valgdeltakelse_value * personer_value
-            stemmer_data.append(stemmer)
-        else:
-            stemmer_data.append(np.nan)
-    return stemmer_data
-
-results = {'Parti': [], 'Distrikt': [], 'Stemmer': [], 'Kategori': []}
-for index, row in df.iterrows():
-    if row['Parti'] not in ['Valgdeltagelse', 'Antall personer med stemmerett']:
-        stemmer_data = calculate_stemmer(row, percentage_dict, participation_dict)
-        for distrikt, stemmer in zip(districts, stemmer_data):
-            results['Parti'].append(row['Parti'])
-            results['Distrikt'].append(distrikt)
-            results['Stemmer'].append(stemmer)
-            results['Kategori'].append(row['Kategori'])
-
-results_df = pd.DataFrame(results)
-
-results_df_english = results_df.copy()
-results_df_english.columns = ['Political Group' if col == 'Parti' else 
-                              'Constituency' if col == 'Distrikt' else 
-                              'Votes' if col == 'Stemmer' else 
-                              col for col in results_df_english.columns]
-if 'Kategori' in results_df_english.columns:
-    results_df_english.drop('Kategori', axis=1, inplace=True)
-
-st.write("### Total votes by party and country")
-st.dataframe(results_df_english)
-
-country_methods = {
-    'Austria': [(d_hondt, 20, 0.04)],
-    'Belgium_Flemish': [(d_hondt, 13, 0.05)],
-    'Belgium_French': [(d_hondt, 8, 0.05)],
-    'Belgium_German': [(d_hondt, 1, 0.05)],
-    'Bulgaria': [(largest_remainder, 17, 0.059, hare_quota)],
-    'Croatia': [(d_hondt, 12, 0.05)],
-    'Cyprus': [(largest_remainder, 6, 0.018, hare_quota)],
-    'Czech Republic': [(d_hondt, 21, 0.05)],
-    'Denmark': [(d_hondt, 15, 0)],
-    'Estonia': [(d_hondt, 7, 0)],
-    'Finland': [(d_hondt, 15, 0)],
-    'France': [(d_hondt, 81, 0.05)],
-    'Germany': [(sainte_lague, 96, 0)],
-    'Greece': [(largest_remainder, 21, 0.03, hare_quota)],
-    'Hungary': [(d_hondt, 21, 0.05)],
-    'Ireland_Dublin': [(sainte_lague, 4, 0)], ## Using Sainte-Laguë instead of Single Transferable Vote for simplicity
-    'Ireland_Midland_North_West': [(sainte_lague, 4, 0)],## Using Sainte-Laguë instead of Single Transferable Vote for simplicity
-    'Ireland_South': [(sainte_lague, 6, 0)], ## Using Sainte-Laguë instead of Single Transferable Vote for simplicity
-    'Italy_North_West': [(largest_remainder, 21, 0.04, hare_quota)],
-    'Italy_North_East': [(largest_remainder, 15, 0.04, hare_quota)],
-    'Italy_Central': [(largest_remainder, 14, 0.04, hare_quota)],
-    'Italy_Southern': [(largest_remainder, 18, 0.04, hare_quota)],
-    'Italy_Islands': [(largest_remainder, 8, 0.04, hare_quota)],
-    'Latvia': [(sainte_lague, 9, 0.05)],
-    'Lithuania': [(largest_remainder, 11, 0.05, hare_quota)],
-    'Luxembourg': [(d_hondt, 6, 0)],
-    'Malta': [(sainte_lague, 6, 0)],## Using Sainte-Laguë instead of Single Transferable Vote for simplicity
-    'Netherlands': [(d_hondt, 31, 0.032)],
-    'Poland_Greater_Poland': [(d_hondt, 4, 0.05)],
-    'Poland_Kuyavian_Pomeranian': [(d_hondt, 2, 0.05)],
-    'Poland_Lesser_Poland_Swietokrzyskie': [(d_hondt, 4, 0.05)],
-    'Poland_Lodz': [(d_hondt, 3, 0.05)],
-    'Poland_Lower_Silesian_Opole': [(d_hondt, 4, 0.05)],
-    'Poland_Lublin': [(d_hondt, 4, 0.05)],
-    'Poland_Lubusz_West_Pomeranian': [(d_hondt, 4, 0.05)],
-    'Poland_Masovian': [(d_hondt, 4, 0.05)],
-    'Poland_Podlaskie_Warmian_Masurian': [(d_hondt, 3, 0.05)],
-    'Poland_Pomeranian': [(d_hondt, 3, 0.05)],
-    'Poland_Silesian': [(d_hondt, 8, 0.05)],
-    'Poland_Subcarpathian': [(d_hondt, 3, 0.05)],
-    'Poland_Warsaw': [(d_hondt, 7, 0.05)],
-    'Portugal': [(d_hondt, 21, 0)],
-    'Romania': [(d_hondt, 33, 0.05)],
-    'Slovakia': [(largest_remainder, 15, 0.05, hare_quota)],
-    'Slovenia': [(d_hondt, 9, 0)],
-    'Spain': [(d_hondt, 61, 0)],
-    'Sweden': [(modified_sainte_lague, 21, 0.04)],
-}
-
-kategori_mapping = dict(zip(df['Parti'], df['Kategori']))
-results_allocation = allocate_seats_by_constituencies(results_df, country_methods)
-
-if 'Parti' in results_allocation.columns and 'Seats' in results_allocation.columns:
-    grouped_results = results_allocation.groupby(['Parti', 'Constituency']).agg({'Seats': 'sum'}).reset_index()
-    grouped_results = pd.merge(grouped_results, df[['Parti', 'Kategori']].drop_duplicates(), on='Parti', how='left')
-else:
-    st.warning("Seat allocation results do not contain the expected columns. Please check the allocation logic.")
-
-grouped_results_english = grouped_results.copy()
-
-grouped_results_english.columns = ['Political Group' if col == 'Parti' else 
-                                   'Constituency' if col == 'Distrikt' else 
-                                   'Seats' if col == 'Seats' else 
-                                   col for col in grouped_results_english.columns]
-
-if 'Kategori' in grouped_results_english.columns:
-    grouped_results_english.drop('Kategori', axis=1, inplace=True)
-
-st.write("### Seat distribution by political group and country")
-st.dataframe(grouped_results_english)
-
-
-color_mapping = {
-    1: '#8B0000',  
-    2: '#FF0000',   
-    3: '#FF6347',   
-    4: '#FF7F7F',   
-    5: '#006400',   
-    6: '#ADD8E6',   
-    7: '#0000FF',   
-    8: '#00008B',   
-    9: '#140080',   
-    10: '#14145A',  
-    11: '#FFFF00'   
-}
-
-
-plot_half_circle_chart(grouped_results, color_mapping, kategori_mapping)
+    image = io.BytesIO()
+    fig.savefig(image, format='png', bbox_inches='tight')
+    return image.getvalue()
+
+# One pool serves the simulations of every session, so concurrent users do
+# not each start os.cpu_count() workers. Workers are spawned rather than
+# forked from the multi-threaded server process.
+SIMULATION_WORKERS = min(4, os.cpu_count() or 1)
+
+@st.cache_resource
+def simulation_executor():
+    return ProcessPoolExecutor(max_workers=SIMULATION_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+
+def plot_half_circle_chart(seat_totals, colors, kategori_mapping, renderer='svg'):
+    aggregated_data = pd.DataFrame({'Parti': list(seat_totals), 'Seats': list(seat_totals.values())})
+    aggregated_data['Kategori'] = aggregated_data['Parti'].map(kategori_mapping)
+    aggregated_data = aggregated_data.sort_values(by='Kategori', ascending=False)
+    if aggregated_data['Seats'].sum() == 0:
+        st.error("The total of seats cannot be zero.")
+        return
+    parties = tuple(aggregated_data['Parti'])
+    kategorier = tuple(int(kategori) for kategori in aggregated_data['Kategori'])
+    seats = tuple(int(seat) for seat in aggregated_data['Seats'])
+    if renderer == 'svg':
+        # Drawn from precomputed seat positions, left-wing groups on the left.
+        svg = hemicycle_svg(parties[::-1], seats[::-1], tuple(colors.get(kategori, "#FFFFFF") for kategori in kategorier[::-1]),
+                            "Seat distribution among political groups in the European Parliament")
+        st.markdown(svg, unsafe_allow_html=True)
+    else:
+        st.image(render_half_circle_chart(parties, kategorier, seats, colors))
+
+
+# The profiler is stopped on every way out of the script, including the
+# exceptions Streamlit raises to stop or restart a rerun.
+profiling = ExitStack()
+profiler_kind = st.session_state.pop('profile_next_run', None)
+try:
+    if profiler_kind:
+        profile = profiling.enter_context(profile_run(profiler_kind))
+    df = pd.DataFrame(default_values)
+    model = default_model()
+    districts = model.districts
+    email_address = "alberto@vthoresen.no"
+    st.title("EU Parliament Election Simulator")
+    st.markdown(f"Contact: [Alberto Valiente Thoresen](mailto:{email_address})")
+    st.markdown("""
+    Adjust your forecasts by using the menu on the left: pick a constituency, move its sliders for vote shares and turnout, and press Apply. A whole table of vote shares can also be pasted or uploaded there.
+
+    The starting point for the simulation is the forecast "vote share by member state" for the EU Parliament Election 2024, presented [here](https://ecfr.eu/publication/a-sharp-right-turn-a-forecast-for-the-2024-european-parliament-elections/) , with rough population estimates for 2024.
+    When not available, vote shares per constituency are estimated on the basis of the expected vote share for the respective member state that the constituency belongs to.
+    Default voter turnout is based on voter participation by country in the EU Parliament Election 2019.
+
+    In the original forecast, the authors warn that "vote shares do not add up to 100 per cent because we do not show minor parties or votes for 'other' parties." 
+    However, in this simulation, vote shares are normalized, so they do add to 100 % by constituency. This starting point might overestimate the number of seats for certain parliamentary groups.
+    You also have to take in consideration that the poll, registered as default values, was published in January 2024. 
+    But you can update these values in the menu, with more accurate and recent forecasts.
+
+    This program calculates seat allocation by applying the correct method used in each constituency for the number of seats available, considering current political group thresholds.
+    These methods include [D'Hont Method](https://en.wikipedia.org/wiki/D%27Hondt_method), [Sainte-Laguë Method (including the modified version)](https://en.wikipedia.org/wiki/Sainte-Lagu%C3%AB_method) and [Largest Remainder Method](https://en.wikipedia.org/wiki/Largest_remainders_method).
+    An overview of the methods used by constituency is presented [here](https://en.wikipedia.org/wiki/2024_European_Parliament_election).
+    Results are merely indicative, given that the methods are applied to political groups, and not to political parties in each constituency.
+    The actual results will therefore differ, also considering threshold effects. However, the discrepancy will not be too large, since parliamentary groups are often represented by one or few parties in each constituency.
+
+    **Note**: For simplicity, this program uses Sainte-Laguë instead of the [Single Transferable Vote (STV)](https://en.wikipedia.org/wiki/Single_transferable_vote) method for Ireland and Malta. The Sainte-Laguë method still provides proportional representation at the political group level. For more information on the intricacies of the STV method, see [Single Transferable Vote - Disadvantages](https://aceproject.org/main/english/es/esf04b.htm). This summary provides a good overview of the challenges involved in forecasting this method solely based on political groups, and programming such forecasts.
+
+    A diagram showing the resulting distribution of seats in the forecast will be presented below. It may take some time to visualize.
+    """)
+
+    # The scenario lives in the session and is edited one constituency at a
+    # time through forms, so only the selected constituency's widgets are built
+    # and a rerun without a submitted change recomputes nothing.
+    with timer.stage('widgets'):
+        if 'scenario' not in st.session_state:
+            st.session_state['scenario'] = model
+        st.sidebar.header("You can adjust percentages and turnout here")
+        edited = st.sidebar.selectbox("Constituency", districts)
+        d = districts.index(edited)
+        scenario = st.session_state['scenario']
+        with st.sidebar.form(f"edit_{edited}"):
+            edited_shares = [st.slider(f"{parti} ({edited})", 0.0, 100.0, round(scenario.shares[d, g] * 100, 6))
+                             for g, parti in enumerate(model.groups)]
+            edited_turnout = st.slider(f"Turnout ({edited})", 0.0, 100.0, round(scenario.turnout[d] * 100, 6))
+            if st.form_submit_button("Apply"):
+                shares = scenario.shares.copy()
+                turnout = scenario.turnout.copy()
+                shares[d] = np.array(edited_shares) / 100
+                turnout[d] = edited_turnout / 100
+                st.session_state['scenario'] = scenario._replace(shares=shares, turnout=turnout)
+        with st.sidebar.expander("Paste or upload a share table"):
+            st.caption("Same layout as the default forecast: a Parti column with political groups (and an optional "
+                       "Turnout row) and one column of percentages per constituency.")
+            with st.form("share_table"):
+                pasted = st.text_area("Paste a table (tab, comma or semicolon separated)")
+                uploaded = st.file_uploader("Or upload a CSV file", type="csv")
+                if st.form_submit_button("Apply table") and (pasted.strip() or uploaded is not None):
+                    try:
+                        table = pd.read_csv(uploaded if uploaded is not None else io.StringIO(pasted), sep=None, engine='python')
+                        st.session_state['scenario'] = apply_share_table(st.session_state['scenario'], table)
+                    except (ValueError, KeyError, pd.errors.ParserError) as error:
+                        st.error(f"The share table was not applied: {error}")
+        if st.sidebar.button("Reset to the default forecast"):
+            st.session_state['scenario'] = model
+        model = st.session_state['scenario']
+        scenario_key = (model.shares.tobytes(), model.turnout.tobytes())
+        st.sidebar.header("Seat diagram")
+        chart_renderer = st.sidebar.radio("Diagram style", ["Hemicycle", "Half circle (matplotlib)"])
+        show_sensitivity = st.sidebar.checkbox("Show votes needed to gain or lose a seat")
+        st.sidebar.header("Uncertainty simulation")
+        run_simulation = st.sidebar.checkbox("Simulate seat distributions (Monte Carlo)")
+        show_performance = st.sidebar.checkbox("Show performance panel")
+        if run_simulation:
+            simulation_draws = st.sidebar.number_input("Number of draws", 1000, 1000000, 20000, step=1000)
+            simulation_concentration = st.sidebar.slider("Vote share concentration (higher means less noise)", 10.0, 2000.0, 200.0)
+            simulation_turnout_sd = st.sidebar.slider("Turnout standard deviation (percentage points)", 0.0, 20.0, 3.0) / 100
+
+
+    if st.session_state.get('results_key') != scenario_key:
+        with timer.stage('calculate_stemmer'):
+            votes = calculate_stemmer(model)
+            results_df = votes_frame(model, votes)
+
+            results_df_english = results_df.copy()
+            results_df_english.columns = ['Political Group' if col == 'Parti' else 
+                                          'Constituency' if col == 'Distrikt' else 
+                                          'Votes' if col == 'Stemmer' else 
+                                          col for col in results_df_english.columns]
+            if 'Kategori' in results_df_english.columns:
+                results_df_english.drop('Kategori', axis=1, inplace=True)
+
+        st.session_state['results_key'] = scenario_key
+        st.session_state['results'] = {'results_df_english': results_df_english}
+    results_df_english = st.session_state['results']['results_df_english']
+
+    st.write("### Total votes by party and country")
+    with timer.stage('render:votes_table'):
+        st.dataframe(results_df_english)
+
+
+    kategori_mapping = dict(zip(df['Parti'], df['Kategori']))
+    for constituency in missing_constituencies(districts, country_methods):
+        st.warning(f"Column for {constituency} not found in the data.")
+    if 'grouped_results' not in st.session_state['results']:
+        # Each session keeps its own cache, so a rerun only re-allocates the
+        # constituencies whose inputs changed.
+        if 'allocation_cache' not in st.session_state:
+            st.session_state['allocation_cache'] = AllocationCache()
+        allocation_cache = st.session_state['allocation_cache']
+        with timer.stage('allocate') as fields:
+            hits, misses = allocation_cache.hits, allocation_cache.misses
+            seats, listed = allocation_cache.allocate(model, country_methods, timer)
+            fields.update(cache_hits=allocation_cache.hits - hits, cache_misses=allocation_cache.misses - misses)
+            # The cache keeps the seat totals up to date by the changed
+            # constituencies only, so the diagram needs no aggregation.
+            seat_totals = {group: int(total) for group, total, shown in zip(model.groups, allocation_cache.totals, listed.any(axis=0))
+                           if shown}
+        with timer.stage('aggregate'):
+            results_allocation = allocation_frame(seats, listed, districts, model.groups, country_methods)
+
+            if 'Parti' in results_allocation.columns and 'Seats' in results_allocation.columns:
+                grouped_results = results_allocation.groupby(['Parti', 'Constituency']).agg({'Seats': 'sum'}).reset_index()
+                grouped_results = pd.merge(grouped_results, df[['Parti', 'Kategori']].drop_duplicates(), on='Parti', how='left')
+            else:
+                st.warning("Seat allocation results do not contain the expected columns. Please check the allocation logic.")
+
+            grouped_results_english = grouped_results.copy()
+
+            grouped_results_english.columns = ['Political Group' if col == 'Parti' else 
+                                               'Constituency' if col == 'Distrikt' else 
+                                               'Seats' if col == 'Seats' else 
+                                               col for col in grouped_results_english.columns]
+
+            if 'Kategori' in grouped_results_english.columns:
+                grouped_results_english.drop('Kategori', axis=1, inplace=True)
+
+        st.session_state['results'].update(grouped_results=grouped_results, grouped_results_english=grouped_results_english,
+                                           seat_totals=seat_totals)
+    grouped_results_english = st.session_state['results']['grouped_results_english']
+
+    st.write("### Seat distribution by political group and country")
+    with timer.stage('render:seats_table'):
+        st.dataframe(grouped_results_english)
+
+
+    color_mapping = {
+        1: '#8B0000',  
+        2: '#FF0000',   
+        3: '#FF6347',   
+        4: '#FF7F7F',   
+        5: '#006400',   
+        6: '#ADD8E6',   
+        7: '#0000FF',   
+        8: '#00008B',   
+        9: '#140080',   
+        10: '#14145A',  
+        11: '#FFFF00'   
+    }
+
+
+    with timer.stage('render:chart', renderer=chart_renderer):
+        plot_half_circle_chart(st.session_state['results']['seat_totals'], color_mapping, kategori_mapping, 'svg' if chart_renderer == "Hemicycle" else 'matplotlib')
+
+    if show_sensitivity:
+        if 'sensitivity' not in st.session_state['results']:
+            with timer.stage('sensitivity'):
+                st.session_state['results']['sensitivity'] = sensitivity_table(model, country_methods)
+        st.write("### Votes needed to gain or lose a seat")
+        st.markdown("Change in votes, with all other votes unchanged, at which a political group wins one more seat "
+                    "or loses one. Share points are in the unit of the vote share sliders. Empty cells mean no such change exists.")
+        st.dataframe(st.session_state['results']['sensitivity'])
+
+    if run_simulation:
+        simulation_key = (int(simulation_draws), simulation_concentration, simulation_turnout_sd)
+        if st.session_state['results'].get('simulation_key') != simulation_key:
+            with timer.stage('simulation', draws=int(simulation_draws)):
+                seat_draws = simulate_seats(model.shares, model.turnout, model.electorate, build_plan(districts, country_methods),
+                                            int(simulation_draws), simulation_concentration, simulation_turnout_sd,
+                                            executor=simulation_executor())
+                st.session_state['results'].update(simulation_key=simulation_key, simulation=summarize_draws(seat_draws, model.groups))
+        st.write(f"### Simulated seat distribution ({int(simulation_draws)} draws)")
+        st.dataframe(st.session_state['results']['simulation'])
+finally:
+    try:
+        profiling.close()
+    finally:
+        timer.log(os.environ.get('SIMULATOR_TIMING_LOG'))
+if profiler_kind:
+    st.session_state['last_profile'] = (profiler_kind, profile)
+
+if show_performance:
+    st.write("### Performance of this rerun")
+    st.write(f"Total: {timer.total() * 1000:.1f} ms")
+    records = pd.DataFrame(timer.records)
+    st.dataframe(records[records['stage'] != 'constituency'].drop(columns=['run', 'level']))
+    if (records['stage'] == 'constituency').any():
+        with st.expander("Allocation time per constituency"):
+            st.dataframe(records[records['stage'] == 'constituency'].dropna(axis=1, how='all').drop(columns=['run', 'level', 'stage']))
+    kind = st.selectbox("Profiler", ['cprofile', 'tracemalloc'])
+    if st.button("Profile the next rerun"):
+        st.session_state['profile_next_run'] = kind
+        st.rerun()
+    if 'last_profile' in st.session_state:
+        kind, profile = st.session_state['last_profile']
+        with st.expander(f"Last {kind} profile"):
+            st.code(profile['text'])
+            st.download_button("Download", profile['data'], file_name='rerun.prof' if kind == 'cprofile' else 'rerun.tracemalloc')
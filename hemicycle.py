@@ -0,0 +1,69 @@
+import math
+from functools import lru_cache
+from html import escape
+
+from allocation import hare_quota, largest_remainder
+
+# Radius of the innermost row, relative to the outermost one.
+INNER_RADIUS = 0.4
+
+
+@lru_cache(maxsize=64)
+def seat_geometry(total_seats):
+    """Seat centres of a hemicycle with ``total_seats`` seats, left to right.
+
+    Seats are spread over concentric rows, each row getting seats in
+    proportion to its length. Coordinates are on a half disc of radius 1
+    centred at the origin. Returns the positions and the seat radius.
+    """
+    if total_seats <= 0:
+        return (), 0.0
+    # Chosen so that the gap between rows is close to the gap between seats.
+    rows = max(1, math.ceil(math.sqrt(0.27 * total_seats)))
+    if rows == 1:
+        radii = [(1 + INNER_RADIUS) / 2]
+    else:
+        radii = [INNER_RADIUS + (1 - INNER_RADIUS) * i / (rows - 1) for i in range(rows)]
+    per_row = largest_remainder(dict(enumerate(radii)), total_seats, hare_quota)
+    seats = []
+    for row, radius in enumerate(radii):
+        n = per_row[row]
+        for j in range(n):
+            angle = math.pi * (1 - j / (n - 1)) if n > 1 else math.pi / 2
+            seats.append((angle, radius))
+    seats.sort(key=lambda seat: (-seat[0], seat[1]))
+    positions = tuple((radius * math.cos(angle), radius * math.sin(angle)) for angle, radius in seats)
+    gaps = [math.pi * radius / (per_row[row] - 1) for row, radius in enumerate(radii) if per_row[row] > 1]
+    if rows > 1:
+        gaps.append((1 - INNER_RADIUS) / (rows - 1))
+    return positions, 0.4 * min(gaps + [0.35])
+
+@lru_cache(maxsize=256)
+def hemicycle_svg(groups, seats, colors, title="", width=700):
+    """Render a hemicycle as an SVG string.
+
+    ``groups``, ``seats`` and ``colors`` are tuples in left-to-right order.
+    Results are cached on these arguments, so an unchanged seat vector is
+    never drawn twice.
+    """
+    positions, dot = seat_geometry(sum(seats))
+    scale = width / 2.2
+    legend_rows = math.ceil(len(groups) / 4)
+    height = 1.25 * scale + 22 * legend_rows
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height:.0f}" '
+             f'viewBox="0 0 {width} {height:.0f}" font-family="sans-serif">']
+    if title:
+        parts.append(f'<text x="{width / 2:.1f}" y="18" text-anchor="middle" font-size="15">{escape(title)}</text>')
+    seat = 0
+    for color, count in zip(colors, seats):
+        for x, y in positions[seat:seat + count]:
+            parts.append(f'<circle cx="{(x + 1.1) * scale:.1f}" cy="{(1.15 - y) * scale:.1f}" r="{dot * scale:.1f}" fill="{color}"/>')
+        seat += count
+    parts.append(f'<text x="{width / 2:.1f}" y="{1.1 * scale:.1f}" text-anchor="middle" font-size="22">{sum(seats)}</text>')
+    for i, (group, count, color) in enumerate(zip(groups, seats, colors)):
+        x = 20 + (i % 4) * (width - 40) / 4
+        y = 1.25 * scale + 22 * (i // 4)
+        parts.append(f'<rect x="{x:.1f}" y="{y - 11:.1f}" width="12" height="12" fill="{color}"/>')
+        parts.append(f'<text x="{x + 18:.1f}" y="{y:.1f}" font-size="13">{escape(f"{group}: {count}")}</text>')
+    parts.append('</svg>')
+    return ''.join(parts)
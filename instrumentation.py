@@ -0,0 +1,134 @@
+import cProfile
+import io
+import json
+import logging
+import marshal
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger('simulator.timing')
+# tracemalloc traces the whole process, so profiles running in several
+# sessions at once share one trace. It is started by the first of them and
+# stopped when the last one exits, unless something else had started it.
+_tracing_lock = threading.Lock()
+_tracing_profiles = 0
+_tracing_started = False
+
+
+class RunTimer:
+    """Wall time and net change in allocated memory blocks per stage of one rerun.
+
+    ``stage`` measures a block of code and yields a dict of extra fields the
+    block may fill in. ``net_allocated_blocks`` is the change in the number
+    of memory blocks held by the interpreter (``sys.getallocatedblocks``)
+    over the stage; it is negative when the stage frees more than it
+    allocates. It is cheap enough to record on every rerun. Peak memory is
+    left to ``profile_run``: tracemalloc's peak is process-wide, so per-stage
+    peaks would mix up sessions running at the same time. Records made inside a
+    stage, such as per-constituency timings, get a higher ``level``.
+    """
+
+    def __init__(self, run_id=None):
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.records = []
+        self._level = 0
+
+    def record(self, stage, seconds, **fields):
+        self.records.append({'run': self.run_id, 'stage': stage, 'level': self._level, 'seconds': seconds, **fields})
+
+    @contextmanager
+    def stage(self, name, **fields):
+        blocks = sys.getallocatedblocks()
+        start = time.perf_counter()
+        self._level += 1
+        try:
+            yield fields
+        finally:
+            self._level -= 1
+            seconds = time.perf_counter() - start
+            fields['net_allocated_blocks'] = sys.getallocatedblocks() - blocks
+            self.record(name, seconds, **fields)
+
+    def total(self):
+        return sum(record['seconds'] for record in self.records if record['level'] == 0)
+
+    def log(self, path=None):
+        """Write one JSON line per record to ``path``, or to the timing logger.
+
+        The logger logs at INFO level and has no handler of its own, so
+        without ``path`` the lines only appear once logging is configured.
+        """
+        lines = [json.dumps(record, default=str) for record in self.records]
+        if path:
+            with open(path, 'a') as handle:
+                handle.writelines(line + '\n' for line in lines)
+        else:
+            for line in lines:
+                logger.info(line)
+
+@contextmanager
+def profile_run(kind):
+    """Profile the enclosed code with ``'cprofile'`` or ``'tracemalloc'``.
+
+    Yields a dict that is filled on exit with ``text`` (a readable report)
+    and ``data`` (pstats or tracemalloc snapshot bytes, for download).
+    """
+    result = {}
+    if kind == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield result
+        finally:
+            profiler.disable()
+            report = io.StringIO()
+            pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(40)
+            result['text'] = report.getvalue()
+            profiler.create_stats()
+            result['data'] = marshal.dumps(profiler.stats)
+    elif kind == 'tracemalloc':
+        _start_tracing()
+        try:
+            yield result
+        finally:
+            try:
+                snapshot = tracemalloc.take_snapshot()
+            finally:
+                _stop_tracing()
+            result['text'] = '\n'.join(str(stat) for stat in snapshot.statistics('lineno')[:40])
+            result['data'] = _dump_snapshot(snapshot)
+    else:
+        raise ValueError(f"Unknown profiler {kind!r}.")
+
+def _start_tracing():
+    global _tracing_profiles, _tracing_started
+    with _tracing_lock:
+        if _tracing_profiles == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+            _tracing_started = True
+        _tracing_profiles += 1
+
+def _stop_tracing():
+    global _tracing_profiles, _tracing_started
+    with _tracing_lock:
+        _tracing_profiles -= 1
+        if _tracing_profiles == 0 and _tracing_started:
+            tracemalloc.stop()
+            _tracing_started = False
+
+def _dump_snapshot(snapshot):
+    handle, path = tempfile.mkstemp(suffix='.tracemalloc')
+    os.close(handle)
+    try:
+        snapshot.dump(path)
+        with open(path, 'rb') as dumped:
+            return dumped.read()
+    finally:
+        os.remove(path)
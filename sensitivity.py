@@ -0,0 +1,201 @@
+import numpy as np
+import pandas as pd
+
+from allocation import allocate_seats_batch, compile_method, eligible_parties, hare_quota
+from election_model import calculate_stemmer
+
+# How a seat flips.
+#
+# Every method here selects the ``seats`` largest "claims" among all
+# parties: quotients v / d_m for the divisor methods, and v / q - m for
+# largest remainder with the Hare quota q (a party is given floor(v / q)
+# seats plus one for a top remainder, which is the same selection). When only
+# party i's votes v' change, i's claim for its (k + 1)-th seat beats another
+# party's claim exactly when v' exceeds a boundary that depends only on that
+# other claim. So i holds k + 1 seats once v' exceeds the (seats - k)-th
+# largest of those boundaries.
+#
+# For divisor methods that is d_k times the (seats - k)-th largest quotient
+# of the other parties. Party i holds k of the seats largest quotients, so
+# that quotient is among them for a gain, and among the seats + 1 largest
+# for a loss unless i holds the last of those. One sorted frontier of
+# seats + 1 quotients per constituency therefore serves every party. For
+# largest remainder the quota moves with v', and the boundary against claim
+# m of party j is seats * (v_j + O) / n - O, with O the other parties' votes
+# and n = seats - k + m: a D'Hondt quotient of v_j + O, selected per party
+# without listing the quotients. Thresholds split v' into intervals with a
+# fixed set of eligible parties; only intervals where that set differs from
+# the current one are solved without the frontier.
+
+
+def _kth_largest_or_zero(values, k):
+    if k <= 0:
+        return np.inf
+    if k > values.size:
+        return 0.0
+    return np.partition(values, values.size - k)[values.size - k]
+
+def _kth_quotient(weights, first, k):
+    """The ``k``-th largest of ``weights[j] / n`` over all j and n >= ``first``.
+
+    Each weight has max(0, floor(w / x) - first + 1) quotients of at least x,
+    so the value is bracketed from these counts and picked from the few
+    quotients inside the bracket, without listing k quotients per weight.
+    """
+    if k <= 0:
+        return np.inf
+    if weights.size == 0:
+        return 0.0
+    # Without the floor, the top t weights hold k quotients above
+    # prefix_t / (k + t * (first - 1)); the largest such value is where
+    # exactly those weights count. With the floor, each weight holds at
+    # most one quotient fewer, which the lower end of the bracket allows for.
+    ordered = np.sort(weights)[::-1]
+    active = np.arange(1, ordered.size + 1)
+    prefix = np.cumsum(ordered)
+    t = np.argmax(prefix / (k + active * (first - 1)))
+    upper = prefix[t] / (k + active[t] * (first - 1)) * (1 + 1e-9)
+    lower = prefix[t] / (k + active[t] * first) * (1 - 1e-9)
+    above = np.maximum(np.floor(weights / upper) - first + 1, 0).astype(np.int64)
+    within = np.maximum(np.floor(weights / lower) - first + 1, 0).astype(np.int64) - above
+    starts = np.cumsum(within) - within
+    owner = np.repeat(np.arange(weights.size), within)
+    n = first + np.repeat(above, within) + np.arange(within.sum()) - np.repeat(starts, within)
+    return _kth_largest_or_zero(weights[owner] / n, k - int(above.sum()))
+
+def _boundary(votes, others, method_plan, claim):
+    """Votes at which party i's claim number ``claim`` enters the top ``seats``."""
+    others_votes = votes[others]
+    seats = method_plan.seats
+    if method_plan.divisors is None:
+        if method_plan.quota_func is not hare_quota:
+            return np.nan
+        if not others_votes.size:
+            return 0.0
+        total = others_votes.sum()
+        return seats * _kth_quotient(others_votes + total, seats - claim, seats - claim) - total
+    divisors = method_plan.divisors
+    return _kth_largest_or_zero((others_votes[:, None] / divisors).ravel(), seats - claim) * divisors[claim]
+
+def _frontier(votes, eligible, method_plan):
+    """The ``seats + 1`` largest quotients of a divisor method and their parties."""
+    parties = np.nonzero(eligible)[0]
+    quotients = (votes[parties, None] / method_plan.divisors).ravel()
+    owners = np.repeat(parties, method_plan.divisors.size)
+    candidates = np.nonzero(quotients >= _kth_largest_or_zero(quotients, method_plan.seats + 1))[0]
+    order = candidates[np.argsort(-quotients[candidates], kind='stable')][:method_plan.seats + 1]
+    return quotients[order], owners[order]
+
+def _read_frontier(frontier, i, rank, divisor):
+    """``divisor`` times the ``rank``-th largest quotient of the parties other than i.
+
+    Returns None when the frontier does not reach that quotient, as when
+    party i holds its last entry.
+    """
+    values, owners = frontier
+    others = np.nonzero(owners != i)[0]
+    if rank <= others.size:
+        return values[others[rank - 1]] * divisor
+    return None
+
+def _eligibility_breaks(votes, i, threshold):
+    """Values of party i's votes at which any party crosses the threshold."""
+    if threshold <= 0:
+        return np.array([])
+    positive = votes > 0
+    positive[i] = False
+    others_total = votes[positive].sum()
+    breaks = list(votes[positive] / threshold - others_total)
+    if threshold < 1:
+        breaks.append(threshold * others_total / (1 - threshold))
+    return np.array(breaks)
+
+def _state(votes, i, value, threshold):
+    trial = votes.copy()
+    trial[i] = value
+    eligible = eligible_parties(trial, threshold)
+    others = eligible.copy()
+    others[i] = False
+    return bool(eligible[i]), others
+
+def seat_flip_votes(votes, method, seats, threshold, quota_func=hare_quota):
+    """Vote changes at which each party gains or loses a seat.
+
+    Returns three arrays over the parties in ``votes``: the current seats,
+    the additional votes a party needs for one more seat, and the (negative)
+    change at which it loses one, with all other votes fixed. NaN means no
+    such change exists, or that the rule has no closed form here (a quota
+    method with a quota other than Hare, such as ``stv_approximation``).
+    Exact ties are resolved by party order, as in the allocation itself, and
+    are not reflected in the boundary.
+    """
+    votes = np.asarray(votes, dtype=float)
+    method_plan = compile_method(method, seats, quota_func)
+    current = allocate_seats_batch(votes, method, seats, threshold, quota_func)
+    eligible = eligible_parties(votes, threshold)
+    frontier = None if method_plan.divisors is None else _frontier(votes, eligible, method_plan)
+    gain = np.full(votes.size, np.nan)
+    loss = np.full(votes.size, np.nan)
+    for i, own in enumerate(np.maximum(votes, 0)):
+        breaks = _eligibility_breaks(votes, i, threshold)
+        current_others = eligible.copy()
+        current_others[i] = False
+        k = current[i]
+        if k < seats:
+            start = own
+            for end in list(np.sort(breaks[breaks > own])) + [np.inf]:
+                inside = start + 1.0 if end == np.inf else (start + end) / 2
+                i_eligible, others = _state(votes, i, inside, threshold)
+                if i_eligible:
+                    boundary = None
+                    if frontier is not None and (others == current_others).all():
+                        boundary = _read_frontier(frontier, i, seats - k, method_plan.divisors[k])
+                    if boundary is None:
+                        boundary = _boundary(votes, others, method_plan, k)
+                    if np.isnan(boundary) or boundary < end:
+                        gain[i] = max(boundary, start) - own
+                        break
+                start = end
+        if k > 0:
+            start = own
+            for end in list(np.sort(breaks[(breaks > 0) & (breaks < own)])[::-1]) + [0.0]:
+                i_eligible, others = _state(votes, i, (start + end) / 2, threshold)
+                if not i_eligible:
+                    loss[i] = start - own
+                    break
+                boundary = None
+                if frontier is not None and (others == current_others).all():
+                    boundary = _read_frontier(frontier, i, seats - k + 1, method_plan.divisors[k - 1])
+                if boundary is None:
+                    boundary = _boundary(votes, others, method_plan, k - 1)
+                if np.isnan(boundary) or boundary > end:
+                    loss[i] = min(boundary, start) - own
+                    break
+                start = end
+            else:
+                loss[i] = -own
+    return current, gain, loss
+
+def sensitivity_table(model, methods, votes=None):
+    """Seat-flip sensitivity for every constituency and group of ``model``.
+
+    Vote changes are also given in share points, the unit of the vote share
+    sliders (votes divided by turnout times electorate, in percent).
+    """
+    votes = calculate_stemmer(model) if votes is None else votes
+    rows = []
+    for d, distrikt in enumerate(model.districts):
+        per_point = model.turnout[d] * model.electorate[d] / 100
+        for method, seats, threshold, *extra in methods.get(distrikt, ()):
+            allocation, gain, loss = seat_flip_votes(votes[d], method, seats, threshold, *extra[:1])
+            for g, group in enumerate(model.groups):
+                rows.append({
+                    'Constituency': distrikt,
+                    'Political Group': group,
+                    'Seats': int(allocation[g]),
+                    'Votes to gain a seat': gain[g],
+                    'Votes to lose a seat': loss[g],
+                    'Share points to gain a seat': gain[g] / per_point if per_point else np.nan,
+                    'Share points to lose a seat': loss[g] / per_point if per_point else np.nan,
+                })
+    return pd.DataFrame(rows)
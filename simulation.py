@@ -0,0 +1,93 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from allocation import allocate_plan
+
+
+def draw_votes(rng, shares, turnout, electorate, draws, concentration=200.0, turnout_sd=0.03):
+    """Draw perturbed votes with shape (draws, constituencies, groups).
+
+    Shares follow a Dirichlet distribution centred on the normalised rows of
+    ``shares``; a higher ``concentration`` means less noise and ``None``
+    disables share noise. Turnout gets normal noise with standard
+    deviation ``turnout_sd`` and is clipped to [0, 1].
+    """
+    shares = np.asarray(shares, dtype=float)
+    if concentration is None:
+        drawn = np.broadcast_to(shares, (draws,) + shares.shape)
+    else:
+        # Dirichlet sampling through gammas, which allows zero shares.
+        totals = shares.sum(axis=-1, keepdims=True)
+        base = np.divide(shares, totals, out=np.zeros_like(shares), where=totals > 0)
+        drawn = rng.gamma(base * concentration, size=(draws,) + base.shape)
+        sums = drawn.sum(axis=-1, keepdims=True)
+        drawn = np.divide(drawn, sums, out=np.zeros_like(drawn), where=sums > 0)
+    turnout = np.broadcast_to(np.asarray(turnout, dtype=float), (draws, shares.shape[0]))
+    if turnout_sd:
+        turnout = np.clip(turnout + rng.normal(0.0, turnout_sd, size=turnout.shape), 0.0, 1.0)
+    # Same multiplication order as calculate_stemmer, so a draw without noise
+    # reproduces the point forecast exactly.
+    return drawn * turnout[:, :, None] * np.asarray(electorate, dtype=float)[:, None]
+
+def allocate_draws(votes, plan):
+    """Total seats per group for each draw of ``votes``."""
+    return allocate_plan(votes, plan).sum(axis=1)
+
+def _simulate_chunk(args):
+    seed, draws, shares, turnout, electorate, plan, concentration, turnout_sd = args
+    rng = np.random.default_rng(seed)
+    votes = draw_votes(rng, shares, turnout, electorate, draws, concentration, turnout_sd)
+    return allocate_draws(votes, plan)
+
+def simulate_seats(shares, turnout, electorate, plan, draws, concentration=200.0, turnout_sd=0.03,
+                   seed=None, chunk_size=2000, workers=None, executor=None):
+    """Run ``draws`` Monte Carlo draws and return seats with shape (draws, groups).
+
+    Draws are split into chunks of ``chunk_size``, each with its own random
+    stream, and spread over a process pool of ``workers`` processes
+    (``os.cpu_count()`` by default). With ``workers=1`` or a single chunk
+    everything runs in the calling process. The result only depends on
+    ``seed`` and ``chunk_size``, not on the number of workers. A long-lived
+    ``executor`` can be passed instead; it is used as is and left running.
+    """
+    sizes = [min(chunk_size, draws - start) for start in range(0, draws, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(s, n, shares, turnout, electorate, plan, concentration, turnout_sd) for s, n in zip(seeds, sizes)]
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if executor is not None and len(tasks) > 1:
+        chunks = list(executor.map(_simulate_chunk, tasks))
+    elif workers <= 1:
+        chunks = [_simulate_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunks = list(executor.map(_simulate_chunk, tasks))
+    if not chunks:
+        return np.zeros((0, np.shape(shares)[-1]), dtype=np.int64)
+    return np.concatenate(chunks)
+
+def summarize_draws(seat_draws, groups, quantiles=(0.05, 0.5, 0.95), coalitions=None):
+    """Seat quantiles and majority probabilities per group.
+
+    A majority is more than half of all seats. ``coalitions`` optionally maps
+    a name to a list of groups whose combined seats are summarised as well.
+    """
+    seat_draws = np.asarray(seat_draws)
+    groups = list(groups)
+    columns = {name: seat_draws[:, i] for i, name in enumerate(groups)}
+    for name, members in (coalitions or {}).items():
+        columns[name] = seat_draws[:, [groups.index(member) for member in members]].sum(axis=1)
+    majority = seat_draws.sum(axis=1) // 2 + 1
+    largest = seat_draws.max(axis=1)
+    rows = []
+    for name, seats in columns.items():
+        row = {'Political Group': name, 'Mean': seats.mean()}
+        for q in quantiles:
+            row[f"P{round(q * 100):02d}"] = np.quantile(seats, q)
+        row['P(majority)'] = np.mean(seats >= majority)
+        if name in groups:
+            row['P(largest group)'] = np.mean(seats == largest)
+        rows.append(row)
+    return pd.DataFrame(rows)
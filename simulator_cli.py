@@ -0,0 +1,214 @@
+"""Allocate seats for many scenarios from the command line.
+
+Each input row is one scenario. A column named ``<district>|<group>`` sets
+that group's vote share in percent, ``<district>|Turnout`` the turnout in
+percent and ``<district>|Electorate`` the number of people entitled to vote.
+Missing columns and empty cells keep the default forecast. An optional
+``scenario`` column names the rows.
+
+    python simulator_cli.py scenarios.csv -o seats.parquet
+
+Input and output are streamed in batches of ``--batch-size`` rows. Parquet
+files need pyarrow; everything else is written as CSV.
+"""
+import argparse
+import csv
+import sys
+
+import numpy as np
+import pandas as pd
+
+from allocation import allocate_plan, build_plan
+from simulator_core import country_methods, default_model
+
+SEPARATOR = '|'
+TURNOUT_COLUMN = 'Turnout'
+ELECTORATE_COLUMN = 'Electorate'
+
+
+def scenario_columns(header, model):
+    """Map input column positions to the model values they override."""
+    districts = {name: d for d, name in enumerate(model.districts)}
+    groups = {name: g for g, name in enumerate(model.groups)}
+    columns = {'shares': [], 'turnout': [], 'electorate': [], 'scenario': None, 'header': list(header)}
+    for position, name in enumerate(header):
+        if name == 'scenario':
+            columns['scenario'] = position
+            continue
+        distrikt, _, field = name.rpartition(SEPARATOR)
+        if distrikt not in districts:
+            raise ValueError(f"Unknown column {name!r}.")
+        if field == TURNOUT_COLUMN:
+            columns['turnout'].append((position, districts[distrikt]))
+        elif field == ELECTORATE_COLUMN:
+            columns['electorate'].append((position, districts[distrikt]))
+        elif field in groups:
+            columns['shares'].append((position, districts[distrikt], groups[field]))
+        else:
+            raise ValueError(f"Unknown column {name!r}.")
+    return columns
+
+def _parse_cells(cells, percentage):
+    """Parse a (rows, columns) array of cells as percentages or counts.
+
+    Returns the values, NaN where a cell is empty, and a mask of the cells
+    that are neither empty nor numbers.
+    """
+    if cells.dtype.kind in 'biuf':
+        values = cells.astype(float)
+        empty = np.isnan(values)
+    else:
+        text = pd.Series(cells.ravel(), dtype=object)
+        empty = (text.isna() | text.eq('')).to_numpy().reshape(cells.shape)
+        try:
+            # Plain numbers convert in one step; '%' signs and thousands
+            # separators need the slower string route.
+            values = np.where(empty, np.nan, cells).astype(float)
+        except ValueError:
+            text = text.astype(str)
+            text = text.str.strip().str.strip('%') if percentage else text.str.replace(',', '', regex=False)
+            values = pd.to_numeric(text, errors='coerce').to_numpy(dtype=float).reshape(cells.shape)
+    if percentage:
+        values = values / 100
+    return values, np.isnan(values) & ~empty
+
+def scenario_votes(model, batch, columns, first_row=1):
+    """Votes with shape (scenarios, districts, groups) for a batch of rows.
+
+    ``batch`` holds one array per input column. Empty cells keep the default
+    forecast; any other cell that does not parse raises ValueError for the
+    first such row. ``first_row`` numbers the rows in messages.
+    """
+    n = len(batch[0])
+    shares = np.repeat(model.shares[None], n, axis=0)
+    turnout = np.repeat(model.turnout[None], n, axis=0)
+    electorate = np.repeat(model.electorate[None], n, axis=0)
+    errors = []
+    for targets, percentage, key in ((shares, True, 'shares'),
+                                     (turnout, True, 'turnout'),
+                                     (electorate, False, 'electorate')):
+        if not columns[key]:
+            continue
+        positions, *cells = zip(*columns[key])
+        values, bad = _parse_cells(np.stack([batch[position] for position in positions], axis=1), percentage)
+        if bad.any():
+            row, column = divmod(int(np.argmax(bad)), len(positions))
+            errors.append((row, positions[column]))
+        given = ~np.isnan(values)
+        rows, column = np.nonzero(given)
+        targets[(rows,) + tuple(np.array(cell)[column] for cell in cells)] = values[given]
+    if errors:
+        row, position = min(errors)
+        raise ValueError(f"Row {first_row + row}, column {columns['header'][position]!r}: "
+                         f"cannot read {batch[position][row]!r}.")
+    return shares * turnout[:, :, None] * electorate[:, :, None]
+
+def read_batches(path, batch_size):
+    """Yield the header, then batches of rows as one array per column.
+
+    Reads CSV or Parquet files. Raises ValueError for an empty file or a CSV
+    row whose number of fields differs from the header's. Rows are numbered
+    from 1 after the header.
+    """
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(path)
+        yield parquet.schema_arrow.names
+        for batch in parquet.iter_batches(batch_size=batch_size):
+            yield [column.to_numpy(zero_copy_only=False) for column in batch.columns]
+        return
+    with (sys.stdin if path == '-' else open(path, newline='')) as handle:
+        reader = csv.reader(handle)
+        header = next(reader, None)
+        if not header:
+            raise ValueError("The input file is empty.")
+        yield header
+        rows = []
+        for number, row in enumerate(reader, start=1):
+            if len(row) != len(header):
+                raise ValueError(f"Row {number} has {len(row)} fields, the header has {len(header)}.")
+            rows.append(row)
+            if len(rows) == batch_size:
+                yield list(np.array(rows, dtype=object).T)
+                rows = []
+        if rows:
+            yield list(np.array(rows, dtype=object).T)
+
+class CsvWriter:
+    def __init__(self, path, header):
+        self._handle = sys.stdout if path == '-' else open(path, 'w', newline='')
+        self._writer = csv.writer(self._handle)
+        self._writer.writerow(header)
+
+    def write(self, columns):
+        self._writer.writerows(zip(*columns))
+
+    def close(self):
+        if self._handle is not sys.stdout:
+            self._handle.close()
+
+class ParquetWriter:
+    def __init__(self, path, header):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._header = header
+        fields = [pa.field(header[0], pa.string())] + [pa.field(name, pa.int64()) for name in header[1:]]
+        self._writer = pq.ParquetWriter(path, pa.schema(fields))
+
+    def write(self, columns):
+        arrays = [self._pa.array([str(value) for value in columns[0]], self._pa.string())]
+        arrays += [self._pa.array(column, self._pa.int64()) for column in columns[1:]]
+        self._writer.write_batch(self._pa.record_batch(arrays, names=self._header))
+
+    def close(self):
+        self._writer.close()
+
+def run(input_path, output_path, batch_size=1000, by_constituency=False, methods=None):
+    """Allocate every scenario in ``input_path`` and write one row per scenario."""
+    model = default_model()
+    methods = country_methods if methods is None else methods
+    plan = build_plan(model.districts, methods)
+    batches = read_batches(input_path, batch_size)
+    columns = scenario_columns(next(batches), model)
+    header = ['scenario'] + list(model.groups)
+    if by_constituency:
+        header += [f"{distrikt}{SEPARATOR}{group}" for distrikt in model.districts for group in model.groups]
+    writer = (ParquetWriter if output_path.endswith('.parquet') else CsvWriter)(output_path, header)
+    count = 0
+    try:
+        for batch in batches:
+            seats = allocate_plan(scenario_votes(model, batch, columns, count + 1), plan)
+            size = len(seats)
+            if columns['scenario'] is None:
+                names = [str(count + i) for i in range(size)]
+            else:
+                names = list(batch[columns['scenario']])
+            output = [names] + list(seats.sum(axis=1).T)
+            if by_constituency:
+                output += list(seats.reshape(size, -1).T)
+            writer.write(output)
+            count += size
+    finally:
+        writer.close()
+    return count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Allocate EU Parliament seats for a file of scenarios.")
+    parser.add_argument('input', help="CSV or Parquet file with one scenario per row ('-' for stdin).")
+    parser.add_argument('-o', '--output', default='-', help="CSV or Parquet output file (default: stdout as CSV).")
+    parser.add_argument('--batch-size', type=int, default=1000, help="Scenarios allocated per batch.")
+    parser.add_argument('--by-constituency', action='store_true', help="Also write seats per constituency and group.")
+    args = parser.parse_args(argv)
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1.")
+    try:
+        count = run(args.input, args.output, args.batch_size, args.by_constituency)
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+    print(f"Allocated {count} scenarios.", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from allocation import (
+    allocate_matrix,
+    d_hondt,
+    hare_quota,
+    largest_remainder,
+    modified_sainte_lague,
+    sainte_lague,
+)
+from election_model import parse_default_values
+
+def convert_to_float(value):
+    try:
+        return float(value.strip('%')) / 100.0
+    except ValueError:
+        return 0.0
+
+def votes_matrix(df):
+    """Pivot long vote rows into a dense constituency x party matrix.
+
+    Returns the matrix with the constituency and party labels of its rows
+    and columns, both in order of first appearance in ``df``.
+    """
+    constituencies = list(df['Distrikt'].unique())
+    parties = list(df['Parti'].unique())
+    matrix = df.pivot(index='Distrikt', columns='Parti', values='Stemmer').reindex(index=constituencies, columns=parties)
+    return matrix.to_numpy(dtype=float), constituencies, parties
+
+def allocate_seats_by_constituencies(df, methods, as_frame=True):
+    matrix, constituencies, parties = votes_matrix(df)
+    return allocate_seats_from_matrix(matrix, constituencies, parties, methods, as_frame)
+
+def missing_constituencies(constituencies, methods):
+    present = set(constituencies)
+    return [constituency for constituency in methods if constituency not in present]
+
+def allocate_seats_from_matrix(matrix, constituencies, parties, methods, as_frame=True):
+    for constituency in missing_constituencies(constituencies, methods):
+        warnings.warn(f"Column for {constituency} not found in the data.")
+    seats, listed = allocate_matrix(matrix, constituencies, methods)
+    if not as_frame:
+        return seats, constituencies, parties
+    return allocation_frame(seats, listed, constituencies, parties, methods)
+
+def allocation_frame(seats, listed, constituencies, parties, methods):
+    """Long ``Parti``/``Constituency``/``Seats`` view of a seat matrix."""
+    position = {constituency: i for i, constituency in enumerate(constituencies)}
+    order = [position[constituency] for constituency in methods if constituency in position]
+    rows, columns = np.nonzero(listed[order])
+    return pd.DataFrame({
+        'Parti': np.array(parties, dtype=object)[columns],
+        'Constituency': np.array(constituencies, dtype=object)[order][rows],
+        'Seats': seats[order][rows, columns],
+    })
+
+def default_model():
+    return parse_default_values(default_values)
+
+default_values = {'Parti': ['EPP', 'S&D', 'ECR', 'RE', 'GUE/NGL', 'G/EFA', 'ID', 'NI', 'Valgdeltagelse', 'Antall personer med stemmerett'], 'Kategori': [8, 3, 9, 6, 1, 5, 10, 11, 11, 11], 'Austria': ['35 %', '24 %', '0 %', '9 %', '0 %', '14 %', '18 %', '0 %', '60 %', '7400000'], 'Belgium_Flemish': ['15 %', '10 %', '19 %', '16 %', '5 %', '12 %', '22 %', '0 %', '88 %', '4700000'], 'Belgium_French': ['10 %', '30 %', '0 %', '22 %', '16 %', '22 %', '0 %', '0 %', '88 %', '3600000'], 'Belgium_German': ['100 %', '0 %', '0 %', '0 %', '0 %', '0 %', '0 %', '0 %', '88 %', '50000'], 'Bulgaria': ['39 %', '31 %', '0 %', '29 %', '0 %', '0 %', '1 %', '0 %', '33 %', '5800000'], 'Croatia': ['47 %', '39 %', '10 %', '0 %', '0 %', '4 %', '0 %', '0 %', '30 %', '3700000'], 'Cyprus': ['26 %', '22 %', '0 %', '19 %', '25 %', '0 %', '0 %', '8 %', '45 %', '700000'], 'Czech Republic': ['24 %', '0 %', '29 %', '0 %', '0 %', '28 %', '18 %', '0 %', '29 %', '8600000'], 'Denmark': ['9 %', '30 %', '0 %', '36 %', '8 %', '18 %', '0 %', '0 %', '66 %', '4500000'], 'Estonia': ['12 %', '27 %', '0 %', '47 %', '0 %', '0 %', '15 %', '0 %', '38 %', '900000'], 'Finland': ['24 %', '17 %', '16 %', '16 %', '8 %', '19 %', '0 %', '0 %', '41 %', '4500000'], 'France': ['18 %', '10 %', '0 %', '0 %', '14 %', '21 %', '37 %', '0 %', '50 %', '48700000'], 'Germany': ['30 %', '17 %', '1 %', '8 %', '7 %', '26 %', '12 %', '0 %', '61 %', '64800000'], 'Greece': ['26 %', '6 %', '3 %', '0 %', '19 %', '0 %', '0 %', '46 %', '59 %', '9900000'], 'Hungary': ['0 %', '55 %', '0 %', '34 %', '0 %', '0 %', '0 %', '11 %', '43 %', '8200000'], 'Ireland_Dublin': ['38 %', '2 %', '0 %', '21 %', '25 %', '15 %', '0 %', '0 %', '50 %', '850000'], 'Ireland_Midland_North_West': ['38 %', '2 %', '0 %', '21 %', '25 %', '15 %', '0 %', '0 %', '50 %', '1300000'], 'Ireland_South': ['38 %', '2 %', '0 %', '21 %', '25 %', '15 %', '0 %', '0 %', '50 %', '1450000'], 'Italy_Central': ['10 %', '25 %', '7 %', '0 %', '0 %', '0 %', '38 %', '19 %', '55 %', '11700000'], 'Italy_Islands': ['10 %', '25 %', '7 %', '0 %', '0 %', '0 %', '38 %', '19 %', '55 %', '6400000'], 'Italy_North_East': ['10 %', '25 %', '7 %', '0 %', '0 %', '0 %', '38 %', '19 %', '55 %', '11500000'], 'Italy_North_West': ['10 %', '25 %', '7 %', '0 %', '0 %', '0 %', '38 %', '19 %', '55 %', '15800000'], 'Italy_Southern': ['10 %', '25 %', '7 %', '0 %', '0 %', '0 %', '38 %', '19 %', '55 %', '13500000'], 'Latvia': ['52 %', '0 %', '32 %', '10 %', '0 %', '6 %', '0 %', '0 %', '34 %', '1500000'], 'Lithuania': ['47 %', '38 %', '0 %', '16 %', '0 %', '0 %', '0 %', '0 %', '53 %', '2400000'], 'Luxembourg': ['29 %', '17 %', '0 %', '29 %', '0 %', '26 %', '0 %', '0 %', '84 %', '500000'], 'Malta': ['59 %', '41 %', '0 %', '0 %', '0 %', '0 %', '0 %', '0 %', '73 %', '400000'], 'Netherlands': ['16 %', '25 %', '9 %', '28 %', '4 %', '14 %', '5 %', '0 %', '42 %', '13300000'], 'Poland_Greater_Poland': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '3250000'], 'Poland_Kuyavian_Pomeranian': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '1800000'], 'Poland_Lesser_Poland_Swietokrzyskie': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '3600000'], 'Poland_Lodz': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '1700000'], 'Poland_Lower_Silesian_Opole': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '2750000'], 'Poland_Lublin': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '1800000'], 'Poland_Lubusz_West_Pomeranian': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '1900000'], 'Poland_Masovian': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '3200000'], 'Poland_Podlaskie_Warmian_Masurian': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '1650000'], 'Poland_Pomeranian': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '1900000'], 'Poland_Silesian': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '3000000'], 'Poland_Subcarpathian': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '1500000'], 'Poland_Warsaw': ['43 %', '8 %', '43 %', '0 %', '0 %', '0 %', '6 %', '0 %', '46 %', '2000000'], 'Portugal': ['30 %', '46 %', '0 %', '3 %', '14 %', '7 %', '0 %', '0 %', '31 %', '9800000'], 'Romania': ['42 %', '29 %', '0 %', '29 %', '0 %', '0 %', '0 %', '0 %', '51 %', '15500000'], 'Slovakia': ['25 %', '0 %', '16 %', '33 %', '0 %', '0 %', '0 %', '26 %', '25 %', '4400000'], 'Slovenia': ['100 %', '0 %', '0 %', '0 %', '0 %', '0 %', '0 %', '0 %', '29 %', '1800000'], 'Spain': ['25 %', '41 %', '8 %', '6 %', '13 %', '7 %', '0 %', '0 %', '61 %', '38100000'], 'Sweden': ['23 %', '32 %', '21 %', '0 %', '9 %', '16 %', '0 %', '0 %', '55 %', '8300000']}
+
+country_methods = {
+    'Austria': [(d_hondt, 20, 0.04)],
+    'Belgium_Flemish': [(d_hondt, 13, 0.05)],
+    'Belgium_French': [(d_hondt, 8, 0.05)],
+    'Belgium_German': [(d_hondt, 1, 0.05)],
+    'Bulgaria': [(largest_remainder, 17, 0.059, hare_quota)],
+    'Croatia': [(d_hondt, 12, 0.05)],
+    'Cyprus': [(largest_remainder, 6, 0.018, hare_quota)],
+    'Czech Republic': [(d_hondt, 21, 0.05)],
+    'Denmark': [(d_hondt, 15, 0)],
+    'Estonia': [(d_hondt, 7, 0)],
+    'Finland': [(d_hondt, 15, 0)],
+    'France': [(d_hondt, 81, 0.05)],
+    'Germany': [(sainte_lague, 96, 0)],
+    'Greece': [(largest_remainder, 21, 0.03, hare_quota)],
+    'Hungary': [(d_hondt, 21, 0.05)],
+    'Ireland_Dublin': [(sainte_lague, 4, 0)], ## Using Sainte-Laguë instead of Single Transferable Vote for simplicity
+    'Ireland_Midland_North_West': [(sainte_lague, 4, 0)],## Using Sainte-Laguë instead of Single Transferable Vote for simplicity
+    'Ireland_South': [(sainte_lague, 6, 0)], ## Using Sainte-Laguë instead of Single Transferable Vote for simplicity
+    'Italy_North_West': [(largest_remainder, 21, 0.04, hare_quota)],
+    'Italy_North_East': [(largest_remainder, 15, 0.04, hare_quota)],
+    'Italy_Central': [(largest_remainder, 14, 0.04, hare_quota)],
+    'Italy_Southern': [(largest_remainder, 18, 0.04, hare_quota)],
+    'Italy_Islands': [(largest_remainder, 8, 0.04, hare_quota)],
+    'Latvia': [(sainte_lague, 9, 0.05)],
+    'Lithuania': [(largest_remainder, 11, 0.05, hare_quota)],
+    'Luxembourg': [(d_hondt, 6, 0)],
+    'Malta': [(sainte_lague, 6, 0)],## Using Sainte-Laguë instead of Single Transferable Vote for simplicity
+    'Netherlands': [(d_hondt, 31, 0.032)],
+    'Poland_Greater_Poland': [(d_hondt, 4, 0.05)],
+    'Poland_Kuyavian_Pomeranian': [(d_hondt, 2, 0.05)],
+    'Poland_Lesser_Poland_Swietokrzyskie': [(d_hondt, 4, 0.05)],
+    'Poland_Lodz': [(d_hondt, 3, 0.05)],
+    'Poland_Lower_Silesian_Opole': [(d_hondt, 4, 0.05)],
+    'Poland_Lublin': [(d_hondt, 4, 0.05)],
+    'Poland_Lubusz_West_Pomeranian': [(d_hondt, 4, 0.05)],
+    'Poland_Masovian': [(d_hondt, 4, 0.05)],
+    'Poland_Podlaskie_Warmian_Masurian': [(d_hondt, 3, 0.05)],
+    'Poland_Pomeranian': [(d_hondt, 3, 0.05)],
+    'Poland_Silesian': [(d_hondt, 8, 0.05)],
+    'Poland_Subcarpathian': [(d_hondt, 3, 0.05)],
+    'Poland_Warsaw': [(d_hondt, 7, 0.05)],
+    'Portugal': [(d_hondt, 21, 0)],
+    'Romania': [(d_hondt, 33, 0.05)],
+    'Slovakia': [(largest_remainder, 15, 0.05, hare_quota)],
+    'Slovenia': [(d_hondt, 9, 0)],
+    'Spain': [(d_hondt, 61, 0)],
+    'Sweden': [(modified_sainte_lague, 21, 0.04)],
+}